@@ -0,0 +1,51 @@
+from __future__ import annotations
+
+import base64
+import hashlib
+from datetime import datetime
+from typing import Any, Iterable
+from uuid import UUID
+
+import orjson
+from fastapi import HTTPException
+
+
+# Keyset-пагинация по (created_at, id): курсор — base64url от {"c": created_at, "i": id} последней записи страницы
+
+MAX_PAGE_LIMIT = 200
+
+
+def clamp_limit(limit: int, default: int = 50) -> int:
+    if limit is None or limit <= 0:
+        return default
+    return min(limit, MAX_PAGE_LIMIT)
+
+
+def encode_cursor(created_at: datetime, row_id: Any) -> str:
+    raw = orjson.dumps({"c": created_at.isoformat(), "i": str(row_id)})
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+
+def decode_cursor(cursor: str) -> tuple[datetime, UUID]:
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        data = orjson.loads(base64.urlsafe_b64decode(padded.encode()))
+        return datetime.fromisoformat(data["c"]), UUID(data["i"])
+    except Exception:
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+
+
+def page_etag(parts: Iterable[Any]) -> str:
+    """Слабый ETag страницы по ключевым полям строк (id, updated_at, status и т.п.)."""
+    digest = hashlib.sha1()
+    for part in parts:
+        digest.update(str(part).encode())
+        digest.update(b"\x1f")
+    return f'W/"{digest.hexdigest()}"'
+
+
+def etag_matches(if_none_match: str | None, etag: str) -> bool:
+    if not if_none_match:
+        return False
+    candidates = [c.strip() for c in if_none_match.split(",")]
+    return "*" in candidates or etag in candidates
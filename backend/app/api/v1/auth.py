@@ -10,8 +10,9 @@ import structlog
 
 from app.core.config import settings
 from app.services.oauth import oauth_service
-from sqlalchemy.orm import Session
-from app.database import get_db
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+from app.database import get_async_db
 from app.db.models import User
 
 router = APIRouter(prefix="/auth", tags=["auth"]) 
@@ -67,7 +68,7 @@ async def _handle_oauth_callback(request: Request, provider: str) -> RedirectRes
 
 
 @router.get("/oauth/{provider}/login")
-async def oauth_login(request: Request, provider: str, db: Session = Depends(get_db)):
+async def oauth_login(request: Request, provider: str, db: AsyncSession = Depends(get_async_db)):
     oauth = oauth_service.get_oauth()
     _validate_provider(provider)
 
@@ -79,11 +80,11 @@ async def oauth_login(request: Request, provider: str, db: Session = Depends(get
         session["anon_user_id"] = anon_user_id
 
     try:
-        existing = db.query(User).filter(User.anon_user_id == anon_user_id).first()
+        existing = (await db.execute(select(User).where(User.anon_user_id == anon_user_id))).scalars().first()
         if existing is None:
             user = User(anon_user_id=anon_user_id)
             db.add(user)
-            db.commit()
+            await db.commit()
     except Exception as exc:  # не блокируем OAuth редирект при проблемах с БД
         logger.warning("oauth_login_user_init_failed", error=str(exc))
 
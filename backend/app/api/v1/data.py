@@ -5,9 +5,11 @@ from datetime import timedelta, datetime
 from typing import Optional
 
 from fastapi import APIRouter, Depends, UploadFile, File, Form, HTTPException
+from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.orm import Session
+from starlette.concurrency import run_in_threadpool
 
-from app.database import get_db
+from app.database import get_async_db, get_db
 from app.db.models import Data as DataModel
 from app.core.config import settings
 from app.services.s3 import get_s3_client, upload_bytes
@@ -31,18 +33,19 @@ def _serialize_data(d: DataModel) -> dict:
 async def upload_multipart(
     type: str = Form(...),
     file: UploadFile = File(...),
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_async_db),
 ):
     if not settings.s3_bucket_name:
         raise HTTPException(status_code=500, detail="S3 is not configured")
     key = f"uploads/{uuid.uuid4()}/{file.filename}"
     content = await file.read()
-    s3_url = upload_bytes(key, content, file.content_type)
+    # boto3 синхронный — загрузка в пуле потоков, запись в БД через asyncpg
+    s3_url = await run_in_threadpool(upload_bytes, key, content, file.content_type)
 
     data = DataModel(id=uuid.uuid4(), type=type, s3_url=s3_url)
     db.add(data)
-    db.commit()
-    db.refresh(data)
+    await db.commit()
+    await db.refresh(data)
     return _serialize_data(data)
 
 
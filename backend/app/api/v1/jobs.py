@@ -1,13 +1,23 @@
 from decimal import Decimal, ROUND_UP
-from fastapi import APIRouter, Depends, HTTPException
-from sqlalchemy.orm import Session
+from fastapi import APIRouter, Depends, HTTPException, Header, Query, Response
+from sqlalchemy import func, select, tuple_
+from sqlalchemy.dialects.postgresql import aggregate_order_by
+from sqlalchemy.orm import Session, load_only
 import logging
 
+from app.api.pagination import clamp_limit, decode_cursor, encode_cursor, etag_matches, page_etag
 from app.database import get_db
-from app.services.fal import submit_generation
-from app.db.models import Job, User, Model
-from app.services.telegram_service import notify_job_event
+from app.db.models import Job, User, Model, JobStatusEnum
 from app.core.config import settings
+from app.services.balance import reserve_tokens
+from app.services.catalog import get_catalog
+from app.services.identity import resolve_user
+from app.services.job_submission import (
+    enqueue_job_submission,
+    extract_image_url,
+    extract_prompt_from_input,
+    is_submittable,
+)
 from app.services.yookassa_service import create_payment as create_yookassa_payment
 from app.services.email_service import send_payment_request_email
  
@@ -125,53 +135,8 @@ def _estimate_price_rub_by_model(model: Model, input_objects: list | None) -> De
 
     return base_price_rub.quantize(Decimal("0.01"), rounding=ROUND_UP) if base_price_rub > 0 else Decimal("0.00")
 
-def _extract_prompt_from_input(input_objects: list | None) -> str | None:
-    if not isinstance(input_objects, list):
-        return None
-    for it in input_objects:
-        if not isinstance(it, dict):
-            continue
-        # Поддержка упрощённого формата: prompt прямо в объекте
-        if isinstance(it.get("prompt"), str) and it.get("prompt").strip():
-            return it.get("prompt").strip()
-        name = it.get("name")
-        typ = it.get("type")
-        if name == "prompt" and (typ in ("text", None)):
-            val = it.get("value")
-            if isinstance(val, str) and val.strip():
-                return val.strip()
-    # Фоллбек: любой text-элемент с value
-    for it in input_objects:
-        if not isinstance(it, dict):
-            continue
-        if (it.get("type") == "text") and isinstance(it.get("value"), str) and it.get("value").strip():
-            return it.get("value").strip()
-    return None
-
-
-def _extract_extra_args(input_objects: list | None) -> dict:
-    args: dict = {}
-    if not isinstance(input_objects, list):
-        return args
-    for it in input_objects:
-        if not isinstance(it, dict):
-            continue
-        name = it.get("name")
-        typ = it.get("type")
-        if not isinstance(name, str) or name in ("prompt", "image_url"):
-            continue
-        if typ == "upload_zone":
-            # загрузки файлов собираем отдельно как image_url
-            continue
-        if "value" in it:
-            val = it.get("value")
-            if isinstance(val, (str, int, float, bool)) and val != "":
-                args[name] = val
-    return args
-
-
-def _serialize_job(job: Job) -> dict:
-    return {
+def _serialize_job(job: Job, include_payload: bool = True) -> dict:
+    data = {
         "id": str(job.id),
         "userId": str(job.user_id) if job.user_id else None,
         "modelId": str(job.model_id) if job.model_id else None,
@@ -181,13 +146,30 @@ def _serialize_job(job: Job) -> dict:
         "priceRub": float(job.price_rub or 0),
         "tokensReserved": float(job.tokens_reserved or 0),
         "tokensConsumed": float(job.tokens_consumed or 0),
-        "input": job.input,
-        "output": job.output,
         "resultUrl": job.result_url,
-        "meta": job.meta,
         "createdAt": job.created_at.isoformat() if job.created_at else None,
         "updatedAt": job.updated_at.isoformat() if job.updated_at else None,
     }
+    if include_payload:
+        data.update({"input": job.input, "output": job.output, "meta": job.meta})
+    return data
+
+
+# Колонки лёгкой проекции списка задач (без JSONB input/output/meta)
+_JOB_LIST_COLUMNS = (
+    Job.id,
+    Job.user_id,
+    Job.model_id,
+    Job.order_id,
+    Job.traffic_type,
+    Job.status,
+    Job.price_rub,
+    Job.tokens_reserved,
+    Job.tokens_consumed,
+    Job.result_url,
+    Job.created_at,
+    Job.updated_at,
+)
 
 
 @router.post("")
@@ -202,7 +184,7 @@ def create_job(payload: dict, db: Session = Depends(get_db)) -> dict:
     input_objects = payload.get("input")
     description = payload.get("description")
     # prompt теперь извлекаем из input (name=prompt, type=text, value)
-    prompt = _extract_prompt_from_input(input_objects) or payload.get("prompt") or description
+    prompt = extract_prompt_from_input(input_objects) or payload.get("prompt") or description
     logger.info(
         "create_job: received payload user_id=%s model_id=%s input_count=%s",
         user_id,
@@ -227,44 +209,20 @@ def create_job(payload: dict, db: Session = Depends(get_db)) -> dict:
             logger.warning("create_job: user not found user_id=%s", user_id)
             raise HTTPException(status_code=404, detail="User not found")
     else:
-        # Попробуем найти существующего по anon_user_id; если нет — по email; если нет — создадим
-        user = db.query(User).filter(User.anon_user_id == anon_user_id).first()
-        if not user and email:
-            # Reuse пользователя с тем же email, чтобы не нарушать уникальность email
-            existing_by_email = db.query(User).filter(User.email == email).first()
-            if existing_by_email:
-                # Если у найденного пользователя нет anon_user_id и он не занят — проставим
-                if anon_user_id and not existing_by_email.anon_user_id:
-                    conflict = db.query(User).filter(User.anon_user_id == anon_user_id).first()
-                    if not conflict:
-                        existing_by_email.anon_user_id = anon_user_id
-                        try:
-                            db.commit()
-                            db.refresh(existing_by_email)
-                        except Exception:
-                            db.rollback()
-                user = existing_by_email
-        if not user:
-            user = User(
-                anon_user_id=anon_user_id,
-                email=email,
-                username=telegram_username,
-                telegram_id=telegram_id,
-            )
-            db.add(user)
-            try:
-                db.commit()
-                db.refresh(user)
-            except Exception:
-                # Возможная гонка/уникальность: попробуем ещё раз найти по email и использовать
-                db.rollback()
-                if email:
-                    user = db.query(User).filter(User.email == email).first()
-                if not user:
-                    raise
-
-    # Получаем модель и её форматы
-    model: Model | None = db.query(Model).filter(Model.id == model_id).first()
+        # Один upsert по anon_user_id; если email уже у другого пользователя — берём его и дописываем anon_user_id
+        user, _ = resolve_user(
+            db,
+            anon_user_id=anon_user_id,
+            email=email,
+            telegram_id=telegram_id,
+            username=telegram_username,
+            key="anon_user_id",
+        )
+
+    # Получаем модель и её форматы: из каталога в памяти, при промахе (новая модель) — из БД
+    model: Model | None = get_catalog().model_by_id(model_id)
+    if model is None:
+        model = db.query(Model).filter(Model.id == model_id).first()
     if not model:
         logger.warning("create_job: model not found model_id=%s", model_id)
         raise HTTPException(status_code=404, detail="Model not found")
@@ -292,33 +250,8 @@ def create_job(payload: dict, db: Session = Depends(get_db)) -> dict:
     # Предварительная валидация входа по форматам
     image_url: str | None = None
     if fmt_from == "image":
-        # Поддержим несколько вариантов структуры:
-        # - { type: "image", url: "..." }
-        # - { image_url: "..." }
-        # - { value: "..." } или { value: ["...", ...] }
-        for it in input_objects or []:
-            if not isinstance(it, dict):
-                continue
-            # прямые поля
-            for key in ("url", "image_url"):
-                val = it.get(key)
-                if isinstance(val, str) and val:
-                    image_url = val
-                    break
-            if image_url:
-                break
-            # value как строка или массив
-            val = it.get("value")
-            if isinstance(val, str) and val:
-                image_url = val
-                break
-            if isinstance(val, list):
-                for cand in val:
-                    if isinstance(cand, str) and cand:
-                        image_url = cand
-                        break
-                if image_url:
-                    break
+        # Поддерживаем варианты { type: "image", url }, { image_url }, { value: "..." | [...] }
+        image_url = extract_image_url(input_objects)
         if not image_url:
             logger.warning(
                 "create_job: missing image url for format_from=image user_id=%s (expected one of: input[].url | input[].image_url | input[].value)",
@@ -346,9 +279,9 @@ def create_job(payload: dict, db: Session = Depends(get_db)) -> dict:
         cost_per_unit_tokens=model.cost_per_unit_tokens,
     )
 
-    if (user.balance_tokens or 0) >= tokens_needed:
-        # резервируем токены и помечаем как оплачено
-        user.balance_tokens = (user.balance_tokens or 0) - Decimal(tokens_needed)
+    # Резерв — один условный UPDATE: параллельные запросы пользователя не спишут баланс дважды
+    if tokens_needed <= 0 or reserve_tokens(db, user.id, Decimal(tokens_needed)) is not None:
+        # токены зарезервированы — помечаем как оплачено
         job.tokens_reserved = Decimal(tokens_needed)
         job.is_paid = True
         job.status = "queued"
@@ -440,322 +373,22 @@ def create_job(payload: dict, db: Session = Depends(get_db)) -> dict:
             logger.exception("create_job: failed to create YooKassa payment for job_id=%s", job.id)
             # Не валим запрос, просто вернём job без paymentUrl
 
-    # Если задача оплачена — ставим генерацию в очередь FAL
-    # image -> video
-    if job.is_paid and fmt_from == "image" and fmt_to == "video":
-        try:
-            # image_url уже провалидирован выше
-            local_prompt = prompt or "Animate this image"
-            order_id = str(job.id)
-            # Сохраним order_id в Job для связки с вебхуками
-            job.order_id = order_id
-            db.commit()
-            db.refresh(job)
-
-            logger.info(
-                "create_job: submitting to FAL (image->video) job_id=%s order_id=%s",
-                job.id,
-                order_id,
-            )
-            # Эндпоинт из модели: options.fal_endpoint | options.endpoint | model.name | дефолт
-            options = model.options or {}
-            endpoint = None
-            if isinstance(options, dict):
-                endpoint = options.get("fal_endpoint") or options.get("endpoint")
-            if not endpoint:
-                endpoint = model.name
-            fal_resp = submit_generation(
-                image_url=image_url,
-                prompt=local_prompt,
-                order_id=order_id,
-                item_index=0,
-                anon_user_id=None,
-                endpoint=endpoint,
-                extra_args=_extract_extra_args(input_objects),
-            )
-            meta = job.meta or {}
-            meta.update({"fal": {"requestId": fal_resp.get("request_id"), "modelId": fal_resp.get("model_id")}})
-            job.meta = meta
-            # Сохраняем request_id FAL в отдельное поле для быстрого доступа поллером
-            if fal_resp.get("request_id"):
-                job.request_id = str(fal_resp.get("request_id"))
-            # Оставляем статус queued; дальнейший прогресс обновится обработчиком вебхуков
-            db.commit()
-            db.refresh(job)
-            logger.info(
-                "create_job: FAL submitted job_id=%s request_id=%s model_id=%s",
-                job.id,
-                (fal_resp or {}).get("request_id"),
-                (fal_resp or {}).get("model_id"),
-            )
-        except Exception as e:
-            # В случае ошибки: откатываем резерв, помечаем failed и возвращаем 502
-            try:
-                tokens_to_return = int(job.tokens_reserved or 0)
-                if tokens_to_return and job.user_id:
-                    user_refund = db.query(User).filter(User.id == job.user_id).first()
-                    if user_refund:
-                        user_refund.balance_tokens = (user_refund.balance_tokens or 0) + tokens_to_return
-                job.tokens_reserved = 0
-                job.is_paid = False
-                job.status = "failed"
-                meta = job.meta or {}
-                meta.update({"falError": str(e)})
-                job.meta = meta
-                db.commit()
-                db.refresh(job)
-            finally:
-                logger.exception(
-                    "create_job: FAL submission failed (image->video) job_id=%s, tokens_refunded=%s",
-                    job.id,
-                    tokens_to_return if 'tokens_to_return' in locals() else 0,
-                )
-            # уведомим Telegram о неуспехе
-            try:
-                notify_job_event(
-                    event="job.failed",
-                    job_id=str(job.id),
-                    user_id=str(job.user_id) if job.user_id else None,
-                    status="failed",
-                    service_type=None,
-                    message=str(e),
-                )
-            except Exception:
-                logger.exception("notify telegram failed for job_id=%s", job.id)
-            raise HTTPException(status_code=502, detail=f"FAL submission failed: {e}")
-
-    # text -> image
-    if job.is_paid and fmt_from == "text" and fmt_to == "image":
-        try:
-            order_id = str(job.id)
-            job.order_id = order_id
-            db.commit()
-            db.refresh(job)
-
-            # Эндпоинт из модели: options.fal_endpoint | options.endpoint | model.name | дефолт
-            options = model.options or {}
-            endpoint = None
-            if isinstance(options, dict):
-                endpoint = options.get("fal_endpoint") or options.get("endpoint")
-            if not endpoint:
-                endpoint = model.name
-
-            logger.info(
-                "create_job: submitting TEXT->IMAGE to FAL job_id=%s order_id=%s endpoint=%s",
-                job.id,
-                order_id,
-                endpoint,
-            )
-            fal_resp = submit_generation(
-                image_url=None,
-                prompt=prompt or "Generate image",
-                order_id=order_id,
-                item_index=0,
-                anon_user_id=None,
-                endpoint=endpoint,
-                extra_args=_extract_extra_args(input_objects),
-            )
-            meta = job.meta or {}
-            meta.update({"fal": {"requestId": fal_resp.get("request_id"), "modelId": fal_resp.get("model_id")}})
-            job.meta = meta
-            if fal_resp.get("request_id"):
-                job.request_id = str(fal_resp.get("request_id"))
-            db.commit()
-            db.refresh(job)
-            logger.info(
-                "create_job: FAL submitted TEXT->IMAGE job_id=%s request_id=%s model_id=%s",
-                job.id,
-                (fal_resp or {}).get("request_id"),
-                (fal_resp or {}).get("model_id"),
-            )
-        except Exception as e:
-            try:
-                tokens_to_return = int(job.tokens_reserved or 0)
-                if tokens_to_return and job.user_id:
-                    user_refund = db.query(User).filter(User.id == job.user_id).first()
-                    if user_refund:
-                        user_refund.balance_tokens = (user_refund.balance_tokens or 0) + tokens_to_return
-                job.tokens_reserved = 0
-                job.is_paid = False
-                job.status = "failed"
-                meta = job.meta or {}
-                meta.update({"falError": str(e)})
-                job.meta = meta
-                db.commit()
-                db.refresh(job)
-            finally:
-                logger.exception(
-                    "create_job: FAL submission (text->image) failed job_id=%s, tokens_refunded=%s",
-                    job.id,
-                    tokens_to_return if 'tokens_to_return' in locals() else 0,
-                )
-            try:
-                notify_job_event(
-                    event="job.failed",
-                    job_id=str(job.id),
-                    user_id=str(job.user_id) if job.user_id else None,
-                    status="failed",
-                    service_type=None,
-                    message=str(e),
-                )
-            except Exception:
-                logger.exception("notify telegram failed for job_id=%s", job.id)
-            raise HTTPException(status_code=502, detail=f"FAL submission failed: {e}")
-
-    # image -> image (например, Photo Restoration)
-    if job.is_paid and fmt_from == "image" and fmt_to == "image":
-        try:
-            order_id = str(job.id)
-            job.order_id = order_id
-            db.commit()
-            db.refresh(job)
-
-            options = model.options or {}
-            endpoint = None
-            if isinstance(options, dict):
-                endpoint = options.get("fal_endpoint") or options.get("endpoint")
-            if not endpoint:
-                endpoint = model.name
-
-            logger.info(
-                "create_job: submitting IMAGE->IMAGE to FAL job_id=%s order_id=%s endpoint=%s",
-                job.id,
-                order_id,
-                endpoint,
-            )
-            fal_resp = submit_generation(
-                image_url=image_url,
-                prompt=prompt or "",
-                order_id=order_id,
-                item_index=0,
-                anon_user_id=None,
-                endpoint=endpoint,
-                extra_args=_extract_extra_args(input_objects),
-            )
-            meta = job.meta or {}
-            meta.update({"fal": {"requestId": fal_resp.get("request_id"), "modelId": fal_resp.get("model_id")}})
-            job.meta = meta
-            if fal_resp.get("request_id"):
-                job.request_id = str(fal_resp.get("request_id"))
-            db.commit()
-            db.refresh(job)
-            logger.info(
-                "create_job: FAL submitted IMAGE->IMAGE job_id=%s request_id=%s model_id=%s",
-                job.id,
-                (fal_resp or {}).get("request_id"),
-                (fal_resp or {}).get("model_id"),
-            )
-        except Exception as e:
-            try:
-                tokens_to_return = int(job.tokens_reserved or 0)
-                if tokens_to_return and job.user_id:
-                    user_refund = db.query(User).filter(User.id == job.user_id).first()
-                    if user_refund:
-                        user_refund.balance_tokens = (user_refund.balance_tokens or 0) + tokens_to_return
-                job.tokens_reserved = 0
-                job.is_paid = False
-                job.status = "failed"
-                meta = job.meta or {}
-                meta.update({"falError": str(e)})
-                job.meta = meta
-                db.commit()
-                db.refresh(job)
-            finally:
-                logger.exception(
-                    "create_job: FAL submission (image->image) failed job_id=%s, tokens_refunded=%s",
-                    job.id,
-                    tokens_to_return if 'tokens_to_return' in locals() else 0,
-                )
-            try:
-                notify_job_event(
-                    event="job.failed",
-                    job_id=str(job.id),
-                    user_id=str(job.user_id) if job.user_id else None,
-                    status="failed",
-                    service_type=None,
-                    message=str(e),
-                )
-            except Exception:
-                logger.exception("notify telegram failed for job_id=%s", job.id)
-            raise HTTPException(status_code=502, detail=f"FAL submission failed: {e}")
-
-    # text -> video
-    if job.is_paid and fmt_from == "text" and fmt_to == "video":
-        try:
-            order_id = str(job.id)
-            job.order_id = order_id
-            db.commit()
-            db.refresh(job)
-
-            # Эндпоинт из модели: options.fal_endpoint | options.endpoint | model.name | дефолт
-            options = model.options or {}
-            endpoint = None
-            if isinstance(options, dict):
-                endpoint = options.get("fal_endpoint") or options.get("endpoint")
-            if not endpoint:
-                endpoint = model.name
-
-            logger.info(
-                "create_job: submitting TEXT->VIDEO to FAL job_id=%s order_id=%s endpoint=%s",
-                job.id,
-                order_id,
-                endpoint,
-            )
-            fal_resp = submit_generation(
-                image_url=None,
-                prompt=prompt or "Generate video",
-                order_id=order_id,
-                item_index=0,
-                anon_user_id=None,
-                endpoint=endpoint,
-                extra_args=_extract_extra_args(input_objects),
-            )
-            meta = job.meta or {}
-            meta.update({"fal": {"requestId": fal_resp.get("request_id"), "modelId": fal_resp.get("model_id")}})
-            job.meta = meta
-            if fal_resp.get("request_id"):
-                job.request_id = str(fal_resp.get("request_id"))
-            db.commit()
-            db.refresh(job)
-            logger.info(
-                "create_job: FAL submitted TEXT->VIDEO job_id=%s request_id=%s model_id=%s",
-                job.id,
-                (fal_resp or {}).get("request_id"),
-                (fal_resp or {}).get("model_id"),
-            )
-        except Exception as e:
-            try:
-                tokens_to_return = int(job.tokens_reserved or 0)
-                if tokens_to_return and job.user_id:
-                    user_refund = db.query(User).filter(User.id == job.user_id).first()
-                    if user_refund:
-                        user_refund.balance_tokens = (user_refund.balance_tokens or 0) + tokens_to_return
-                job.tokens_reserved = 0
-                job.is_paid = False
-                job.status = "failed"
-                meta = job.meta or {}
-                meta.update({"falError": str(e)})
-                job.meta = meta
-                db.commit()
-                db.refresh(job)
-            finally:
-                logger.exception(
-                    "create_job: FAL submission (text->video) failed job_id=%s, tokens_refunded=%s",
-                    job.id,
-                    tokens_to_return if 'tokens_to_return' in locals() else 0,
-                )
-            try:
-                notify_job_event(
-                    event="job.failed",
-                    job_id=str(job.id),
-                    user_id=str(job.user_id) if job.user_id else None,
-                    status="failed",
-                    service_type=None,
-                    message=str(e),
-                )
-            except Exception:
-                logger.exception("notify telegram failed for job_id=%s", job.id)
-            raise HTTPException(status_code=502, detail=f"FAL submission failed: {e}")
+    # Если задача оплачена — ставим отправку в FAL в очередь RQ.
+    # Пресайн, вызов fal_client и запись request_id выполняет воркер, ответ API их не ждёт.
+    if job.is_paid and is_submittable(model):
+        # Сохраним order_id в Job для связки с вебхуками
+        job.order_id = str(job.id)
+        db.commit()
+        db.refresh(job)
+        logger.info(
+            "create_job: enqueue FAL submission (%s->%s) job_id=%s order_id=%s",
+            fmt_from,
+            fmt_to,
+            job.id,
+            job.order_id,
+        )
+        enqueue_job_submission(str(job.id))
+        db.refresh(job)
 
     resp = _serialize_job(job)
     if payment_url:
@@ -763,16 +396,74 @@ def create_job(payload: dict, db: Session = Depends(get_db)) -> dict:
     return resp
 
 
+# Список и карточка задачи читаются сразу после create_job и смены статуса — с мастера (read-your-writes)
 @router.get("")
-def list_jobs(userId: str, db: Session = Depends(get_db)) -> list[dict]:
-    logger.debug("list_jobs: user_id=%s", userId)
-    items = (
-        db.query(Job)
-        .filter(Job.user_id == userId)
-        .order_by(Job.created_at.desc())
-        .all()
+def list_jobs(
+    response: Response,
+    userId: str,
+    limit: int = 50,
+    cursor: str | None = None,
+    status: list[str] | None = Query(default=None),
+    includePayload: bool = False,
+    if_none_match: str | None = Header(default=None, alias="If-None-Match"),
+    db: Session = Depends(get_db),
+):
+    """Страница задач пользователя, новые сначала.
+
+    Keyset-пагинация по (created_at, id): курсор следующей страницы отдаётся в заголовке
+    X-Next-Cursor. input/output/meta включаются только при includePayload=true.
+    ETag считается до загрузки страницы лёгким запросом (id строк окна и max(updated_at) —
+    updated_at сдвигается при любом изменении задачи), поэтому 304 по If-None-Match не читает
+    и не сериализует сами задачи.
+    """
+    logger.debug("list_jobs: user_id=%s cursor=%s status=%s", userId, cursor, status)
+    page_size = clamp_limit(limit)
+    if status:
+        unknown = [s for s in status if s not in JobStatusEnum.enums]
+        if unknown:
+            raise HTTPException(status_code=400, detail=f"Unknown status: {', '.join(unknown)}")
+
+    filters = [Job.user_id == userId]
+    if status:
+        filters.append(Job.status.in_(status))
+    if cursor:
+        cursor_created_at, cursor_id = decode_cursor(cursor)
+        filters.append(tuple_(Job.created_at, Job.id) < tuple_(cursor_created_at, cursor_id))
+    order_by = (Job.created_at.desc(), Job.id.desc())
+
+    window = (
+        select(Job.id, Job.created_at, Job.updated_at)
+        .where(*filters)
+        .order_by(*order_by)
+        .limit(page_size + 1)
+        .subquery()
+    )
+    last_updated_at, window_ids = db.execute(
+        select(
+            func.max(window.c.updated_at),
+            func.array_agg(aggregate_order_by(window.c.id, window.c.created_at.desc(), window.c.id.desc())),
+        )
+    ).one()
+    etag = page_etag(
+        [userId, cursor, ",".join(sorted(status or [])), includePayload, page_size, last_updated_at]
+        + list(window_ids or [])
     )
-    return [_serialize_job(j) for j in items]
+    headers = {"ETag": etag, "Cache-Control": "private, no-cache"}
+    if etag_matches(if_none_match, etag):
+        # X-Next-Cursor клиент берёт из сохранённого ответа с тем же ETag
+        return Response(status_code=304, headers=headers)
+
+    query = db.query(Job).filter(*filters)
+    if not includePayload:
+        query = query.options(load_only(*_JOB_LIST_COLUMNS))
+    items = query.order_by(*order_by).limit(page_size + 1).all()
+
+    has_more = len(items) > page_size
+    items = items[:page_size]
+    if has_more and items:
+        headers["X-Next-Cursor"] = encode_cursor(items[-1].created_at, items[-1].id)
+    response.headers.update(headers)
+    return [_serialize_job(j, include_payload=includePayload) for j in items]
 
 
 @router.get("/{job_id}")
@@ -4,7 +4,7 @@ from datetime import datetime, timezone
 from fastapi import APIRouter, Depends, HTTPException
 from sqlalchemy.orm import Session
 
-from app.database import get_db
+from app.database import get_db, get_read_db
 from app.db.models import Lottery, LotteryEntry
 
 router = APIRouter(prefix="/lotteries", tags=["Lotteries"]) 
@@ -35,7 +35,7 @@ def _serialize_entry(e: LotteryEntry) -> dict:
 
 
 @router.get("/current")
-def current(db: Session = Depends(get_db)) -> dict:
+def current(db: Session = Depends(get_read_db)) -> dict:
     now = datetime.now(timezone.utc)
     lot = (
         db.query(Lottery)
@@ -52,7 +52,7 @@ def current(db: Session = Depends(get_db)) -> dict:
 
 
 @router.get("/history")
-def history(db: Session = Depends(get_db)) -> list[dict]:
+def history(db: Session = Depends(get_read_db)) -> list[dict]:
     items = db.query(Lottery).order_by(Lottery.start_date.desc()).all()
     return [_serialize_lottery(l) for l in items]
 
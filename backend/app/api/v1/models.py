@@ -1,78 +1,31 @@
-from typing import Any
+from fastapi import APIRouter, HTTPException, Response
 
-from fastapi import APIRouter, Depends, HTTPException
-from sqlalchemy import or_, text
-from sqlalchemy.orm import Session
-
-from app.database import get_db
-from app.db.models import Model
+from app.services.catalog import canonical_model_id, catalog, get_catalog
 
 router = APIRouter(prefix="/models", tags=["models"]) 
 
 
+# Каталог обслуживается из памяти процесса (app.services.catalog) — Postgres на чтении не участвует
 @router.get("")
-def list_models(q: str | None = None, category: str | None = None, format_from: str | None = None, format_to: str | None = None, page: int = 1, limit: int = 20, db: Session = Depends(get_db)) -> dict:
-    query = db.query(Model)
-
-    if q:
-        ilike = f"%{q}%"
-        query = query.filter(or_(Model.title.ilike(ilike), Model.name.ilike(ilike)))
-
-    if category:
-        query = query.filter(Model.category_id == category)
-
-    # Простейшая фильтрация по JSONB (contains по строке)
-    if format_from:
-        query = query.filter(text("format_from::text ILIKE :ff")).params(ff=f"%{format_from}%")
-    if format_to:
-        query = query.filter(text("format_to::text ILIKE :ft")).params(ft=f"%{format_to}%")
-
-    total = query.count()
-    items = query.order_by(Model.created_at.desc()).offset((page - 1) * limit).limit(limit).all()
-
-    def serialize(m: Model) -> dict[str, Any]:
-        return {
-            "id": str(m.id),
-            "title": m.title,
-            "name": m.name,
-            "description": m.description,
-            "category_id": str(m.category_id) if m.category_id else None,
-            "cost_unit": m.cost_unit,
-            "cost_per_unit_tokens": float(m.cost_per_unit_tokens or 0),
-            "currency": m.currency,
-            "format_from": m.format_from,
-            "format_to": m.format_to,
-            "banner_image_url": m.banner_image_url,
-            "hint": m.hint,
-            "max_file_count": m.max_file_count,
-            "options": m.options,
-            "created_at": m.created_at.isoformat() if m.created_at else None,
-        }
-
-    return {"items": [serialize(m) for m in items], "total": total}
+def list_models(q: str | None = None, category: str | None = None, format_from: str | None = None, format_to: str | None = None, page: int = 1, limit: int = 20) -> dict:
+    snapshot = get_catalog()
+    items = snapshot.search_models(q=q, category=category, format_from=format_from, format_to=format_to)
+    offset = max(page - 1, 0) * limit
+    page_items = items[offset:offset + limit] if limit > 0 else []
+    return {"items": [snapshot.serialized[str(m.id)] for m in page_items], "total": len(items)}
 
 
 @router.get("/{model_id}")
-def get_model(model_id: str, db: Session = Depends(get_db)) -> dict:
-    model = db.query(Model).filter(Model.id == model_id).first()
-    if not model:
+def get_model(model_id: str) -> Response:
+    key = canonical_model_id(model_id)
+    if key is None:
         raise HTTPException(status_code=404, detail="Model not found")
-
-    return {
-        "id": str(model.id),
-        "title": model.title,
-        "name": model.name,
-        "description": model.description,
-        "category_id": str(model.category_id) if model.category_id else None,
-        "cost_unit": model.cost_unit,
-        "cost_per_unit_tokens": float(model.cost_per_unit_tokens or 0),
-        "currency": model.currency,
-        "format_from": model.format_from,
-        "format_to": model.format_to,
-        "banner_image_url": model.banner_image_url,
-        "hint": model.hint,
-        "max_file_count": model.max_file_count,
-        "options": model.options,
-        "created_at": model.created_at.isoformat() if model.created_at else None,
-    }
-
+    body = get_catalog().json.get(key)
+    if body is None:
+        # Модель могла появиться после последнего обновления снимка — сверяемся с БД
+        snapshot = catalog.refresh_if_model_exists(key)
+        body = snapshot.json.get(key) if snapshot is not None else None
+    if body is None:
+        raise HTTPException(status_code=404, detail="Model not found")
+    # Тело сериализовано заранее при построении снимка
+    return Response(content=body, media_type="application/json")
@@ -5,8 +5,9 @@ from sqlalchemy import func
 from decimal import Decimal
 from sqlalchemy.orm import Session
 
-from app.database import get_db
+from app.database import get_db, get_read_db, retry_on_primary
 from app.db.models import User, Referral, Transaction
+from app.services.balance import credit_tokens
 
 router = APIRouter(prefix="/referrals", tags=["Referrals"]) 
 
@@ -27,8 +28,10 @@ def get_link(userId: str, db: Session = Depends(get_db)) -> dict:
 
 
 @router.get("/stats")
-def get_stats(userId: str, db: Session = Depends(get_db)) -> dict:
+def get_stats(userId: str, db: Session = Depends(get_read_db)) -> dict:
     user = db.query(User).filter(User.id == userId).first()
+    if not user and retry_on_primary(db):
+        user = db.query(User).filter(User.id == userId).first()
     if not user:
         raise HTTPException(status_code=404, detail="User not found")
 
@@ -48,7 +51,7 @@ def get_stats(userId: str, db: Session = Depends(get_db)) -> dict:
 
 
 @router.get("/history")
-def get_history(userId: str, db: Session = Depends(get_db)) -> list[dict]:
+def get_history(userId: str, db: Session = Depends(get_read_db)) -> list[dict]:
     items = (
         db.query(Referral, User.username.label("invitee_username"))
         .outerjoin(User, User.id == Referral.invitee_id)
@@ -109,7 +112,7 @@ def apply_referral_code(payload: dict, idempotency_key: str | None = Header(defa
     bonus_granted = False
     bonus_tokens = Decimal(15)
     if existing.inviter_id == inviter.id and not existing.reward_given:
-        inviter.balance_tokens = (inviter.balance_tokens or 0) + bonus_tokens
+        credit_tokens(db, inviter.id, bonus_tokens)
         txn = Transaction(
             user_id=inviter.id,
             type="promo",
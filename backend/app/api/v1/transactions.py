@@ -1,16 +1,18 @@
 from typing import Any
 
-from fastapi import APIRouter, Depends
-from sqlalchemy.orm import Session
+from fastapi import APIRouter, Depends, Response
+from sqlalchemy import func, tuple_
+from sqlalchemy.orm import Session, load_only
 
+from app.api.pagination import clamp_limit, decode_cursor, encode_cursor
 from app.database import get_db
 from app.db.models import Transaction
 
 router = APIRouter(prefix="/transactions", tags=["Transactions"]) 
 
 
-def _serialize_txn(t: Transaction) -> dict[str, Any]:
-    return {
+def _serialize_txn(t: Transaction, include_meta: bool = True) -> dict[str, Any]:
+    data = {
         "id": str(t.id),
         "userId": str(t.user_id) if t.user_id else None,
         "jobId": str(t.job_id) if t.job_id else None,
@@ -22,24 +24,106 @@ def _serialize_txn(t: Transaction) -> dict[str, Any]:
         "currency": t.currency,
         "plan": t.plan,
         "reference": t.reference,
-        "meta": t.meta,
         "createdAt": t.created_at.isoformat() if t.created_at else None,
     }
+    if include_meta:
+        data["meta"] = t.meta
+    return data
+
+
+# Колонки лёгкой проекции (meta содержит сырые тела вебхуков YooKassa — по умолчанию не читаем)
+_TXN_LIST_COLUMNS = (
+    Transaction.id,
+    Transaction.user_id,
+    Transaction.job_id,
+    Transaction.type,
+    Transaction.provider,
+    Transaction.status,
+    Transaction.amount_rub,
+    Transaction.tokens_delta,
+    Transaction.currency,
+    Transaction.plan,
+    Transaction.reference,
+    Transaction.created_at,
+)
 
 
 @router.get("")
-def list_transactions(userId: str, db: Session = Depends(get_db)) -> list[dict]:
+def list_transactions(
+    response: Response,
+    userId: str,
+    limit: int = 50,
+    cursor: str | None = None,
+    includeMeta: bool = False,
+    includeSummary: bool = False,
+    db: Session = Depends(get_db),
+) -> list[dict] | dict:
+    """Страница транзакций пользователя, новые сначала.
+
+    Keyset-пагинация по (created_at, id) по индексу ix_transactions_user_created; курсор следующей
+    страницы — в заголовке X-Next-Cursor. meta включается только при includeMeta=true.
+    При includeSummary=true ответ — {"items": [...], "summary": {...}} с итогами по всем
+    транзакциям пользователя (не только по странице).
+    """
+    page_size = clamp_limit(limit)
+    query = db.query(Transaction).filter(Transaction.user_id == userId)
+    if cursor:
+        cursor_created_at, cursor_id = decode_cursor(cursor)
+        query = query.filter(tuple_(Transaction.created_at, Transaction.id) < tuple_(cursor_created_at, cursor_id))
+    if not includeMeta:
+        query = query.options(load_only(*_TXN_LIST_COLUMNS))
     items = (
-        db.query(Transaction)
+        query.order_by(Transaction.created_at.desc(), Transaction.id.desc())
+        .limit(page_size + 1)
+        .all()
+    )
+    if len(items) > page_size:
+        items = items[:page_size]
+        response.headers["X-Next-Cursor"] = encode_cursor(items[-1].created_at, items[-1].id)
+    page = [_serialize_txn(t, include_meta=includeMeta) for t in items]
+    if includeSummary:
+        return {"items": page, "summary": _summarize(db, userId)}
+    return page
+
+
+def _summarize(db: Session, userId: str) -> dict:
+    """Агрегаты по транзакциям пользователя (по type/provider) одним GROUP BY-запросом."""
+    rows = (
+        db.query(
+            Transaction.type,
+            Transaction.provider,
+            func.count(Transaction.id),
+            func.coalesce(func.sum(Transaction.amount_rub), 0),
+            func.coalesce(func.sum(Transaction.tokens_delta), 0),
+        )
         .filter(Transaction.user_id == userId)
-        .order_by(Transaction.created_at.desc())
+        .group_by(Transaction.type, Transaction.provider)
         .all()
     )
-    return [_serialize_txn(t) for t in items]
+    groups: list[dict[str, Any]] = []
+    total_count = 0
+    total_amount = 0.0
+    total_tokens = 0.0
+    for typ, provider, count, amount_rub, tokens_delta in rows:
+        groups.append({
+            "type": str(typ) if typ is not None else None,
+            "provider": str(provider) if provider is not None else None,
+            "count": int(count or 0),
+            "amountRub": float(amount_rub or 0),
+            "tokensDelta": float(tokens_delta or 0),
+        })
+        total_count += int(count or 0)
+        total_amount += float(amount_rub or 0)
+        total_tokens += float(tokens_delta or 0)
+    return {
+        "count": total_count,
+        "amountRub": total_amount,
+        "tokensDelta": total_tokens,
+        "groups": groups,
+    }
 
 
 # Временная заглушка вне спецификации (может быть удалена)
 @router.post("/checkout")
 def checkout(amount_rub: float) -> dict:
     return {"checkoutUrl": "https://yookassa.example/checkout/stub"}
-
@@ -1,4 +1,3 @@
-from uuid import uuid4
 from fastapi import APIRouter, Depends, HTTPException, Header
 from sqlalchemy.orm import Session
 from sqlalchemy import func, or_
@@ -6,6 +5,7 @@ from decimal import Decimal
 
 from app.database import get_db
 from app.db.models import User, Referral, Transaction
+from app.services.identity import resolve_user
 
 router = APIRouter(prefix="/users", tags=["Users"]) 
 
@@ -38,54 +38,24 @@ def register_or_login(payload: dict, db: Session = Depends(get_db)) -> dict:
     anon_user_id = payload.get("anonUserId")
     ref_code = payload.get("refCode")
 
-    user = db.query(User).filter(User.telegram_id == str(telegram_id)).first()
-    if not user:
-        user = User(
-            telegram_id=str(telegram_id),
-            username=username,
-            anon_user_id=anon_user_id,
-        )
-        # генерируем свой реф-код, если пустой
-        user.ref_code = user.ref_code or uuid4().hex[:8]
-        # применяем реферал, если передан и валиден
-        if ref_code and ref_code != user.ref_code:
-            inviter = db.query(User).filter(User.ref_code == ref_code).first()
-            if inviter and inviter.id != user.id:
-                user.referrer_id = inviter.id
-        db.add(user)
-        db.commit()
-        db.refresh(user)
-
-        # создаём запись Referral (без бонусов, они начисляются при оплате)
-        if user.referrer_id:
-            existing = (
-                db.query(Referral)
-                .filter(Referral.inviter_id == user.referrer_id, Referral.invitee_id == user.id)
-                .first()
-            )
-            if existing is None:
-                db.add(Referral(inviter_id=user.referrer_id, invitee_id=user.id))
-                db.commit()
-
-    else:
-        # обновим дублирующиеся поля
-        changed = False
-        if username and user.username != username:
-            user.username = username
-            changed = True
-        if anon_user_id and not user.anon_user_id:
-            user.anon_user_id = anon_user_id
-            changed = True
-        if not user.ref_code:
-            user.ref_code = uuid4().hex[:8]
-            changed = True
-        if changed:
-            db.commit()
-            db.refresh(user)
+    # Один upsert по telegram_id: новому пользователю — свой реф-код и реферер по refCode,
+    # существующему — обновлённый username и заполненные пустые anon_user_id/ref_code
+    user, created = resolve_user(
+        db,
+        telegram_id=str(telegram_id),
+        anon_user_id=anon_user_id,
+        username=username,
+        ref_code=ref_code,
+    )
+    # создаём запись Referral (без бонусов, они начисляются при оплате)
+    if created and user.referrer_id:
+        db.add(Referral(inviter_id=user.referrer_id, invitee_id=user.id))
+    db.commit()
 
     return _serialize_user(user)
 
 
+# Баланс читается сразу после списаний/пополнений — только с мастера (read-your-writes)
 @router.get("/{user_id}")
 def get_user_by_id(user_id: str, db: Session = Depends(get_db)) -> dict:
     user = db.query(User).filter(User.id == user_id).first()
@@ -1,11 +1,23 @@
+import logging
 import os
-from typing import Tuple, Dict, Any
+import ssl
+import threading
+import time
+import weakref
+from typing import AsyncIterator, Tuple, Dict, Any, Optional
 
-from sqlalchemy import create_engine
-from sqlalchemy.orm import sessionmaker
-from sqlalchemy.pool import QueuePool
+from sqlalchemy import Select, create_engine, text
+from sqlalchemy import exc as sa_exc
+from sqlalchemy.engine import Engine, make_url
+from sqlalchemy.ext.asyncio import AsyncEngine, AsyncSession, async_sessionmaker, create_async_engine
+from sqlalchemy.orm import Session, sessionmaker
+from sqlalchemy.pool import AsyncAdaptedQueuePool, QueuePool
 
 from app.core.config import settings
+from app.services.metrics import DB_POOL_REJECTED, DB_POOL_WAIT_SECONDS
+
+
+logger = logging.getLogger(__name__)
 
 
 def _build_conn() -> Tuple[str, Dict[str, Any]]:
@@ -18,9 +30,11 @@ def _build_conn() -> Tuple[str, Dict[str, Any]]:
         password = os.getenv("POSTGRES_PASSWORD", "")
         sslrootcert = os.getenv("POSTGRES_SSLROOTCERT", "/certs/root.crt")
 
-        first_host = host_env.split(",")[0].strip()
-        url = f"postgresql://{user}:{password}@{first_host}:{port}/{database}"
+        hosts = [h.strip() for h in host_env.split(",") if h.strip()]
+        url = f"postgresql://{user}:{password}@{hosts[0]}:{port}/{database}"
         connect_args: Dict[str, Any] = {
+            # Все хосты кластера: libpq сам найдёт текущий мастер (переживает переключение мастера)
+            "host": ",".join(hosts),
             "sslmode": os.getenv("POSTGRES_SSLMODE", "verify-full"),
             "sslrootcert": sslrootcert,
             "target_session_attrs": "primary",
@@ -56,21 +70,148 @@ def _build_conn() -> Tuple[str, Dict[str, Any]]:
 
 database_url, connect_args = _build_conn()
 
-engine = create_engine(
-    database_url,
-    connect_args=connect_args,
-    poolclass=QueuePool,
-    pool_size=10,
-    max_overflow=20,
-    pool_timeout=60,
-    pool_recycle=3600,
-    pool_pre_ping=True,
-    echo=False,
+
+def _build_replica_conn() -> Optional[Tuple[str, Dict[str, Any]]]:
+    """Подключение для чтения с реплик или None, если реплики не настроены.
+
+    POSTGRES_REPLICA_HOSTS (по умолчанию — хосты POSTGRES_HOST, если их несколько) с
+    target_session_attrs=prefer-standby: libpq выбирает реплику, а если живых реплик нет — мастер.
+    Без POSTGRES_* — отдельная DATABASE_REPLICA_URL.
+    """
+    host_env = os.getenv("POSTGRES_HOST", "").strip()
+    if host_env:
+        replica_hosts = os.getenv("POSTGRES_REPLICA_HOSTS", "").strip()
+        if not replica_hosts and "," not in host_env:
+            return None
+        hosts = [h.strip() for h in (replica_hosts or host_env).split(",") if h.strip()]
+        replica_args = dict(connect_args)
+        replica_args.update({
+            "host": ",".join(hosts),
+            "target_session_attrs": "prefer-standby",
+            "application_name": "kreatum_backend_ro",
+        })
+        return database_url, replica_args
+
+    replica_url = os.getenv("DATABASE_REPLICA_URL", "").strip()
+    if replica_url:
+        replica_args = dict(connect_args)
+        replica_args.pop("target_session_attrs", None)
+        return replica_url, replica_args
+    return None
+
+class PoolOverloaded(sa_exc.TimeoutError):
+    """Пул исчерпан и очередь ожидающих уже полна — отказ без ожидания pool_timeout."""
+
+
+# Лимит потоков, одновременно ждущих соединение, по имени пула (0 — без лимита)
+POOL_MAX_WAITERS: Dict[str, int] = {}
+
+# Все инструментированные пулы процесса — для метрик db_pool_* (metrics.PoolCollector)
+INSTRUMENTED_POOLS: "weakref.WeakSet[_InstrumentedPoolMixin]" = weakref.WeakSet()
+
+
+class _InstrumentedPoolMixin:
+    """Время ожидания соединения из пула и быстрый отказ при насыщении.
+
+    Имя пула берётся из pool_logging_name (переживает engine.dispose()/recreate).
+    Ожидание ограничено pool_timeout, а если пул исчерпан и ждущих уже POOL_MAX_WAITERS[имя],
+    новый запрос получает PoolOverloaded сразу. Оба исключения — sqlalchemy.exc.TimeoutError,
+    API отвечает на них 503 с Retry-After.
+    """
+
+    def __init__(self, *args, **kw) -> None:
+        super().__init__(*args, **kw)
+        self._waiters_lock = threading.Lock()
+        self.waiting = 0
+        INSTRUMENTED_POOLS.add(self)
+
+    @property
+    def label(self) -> str:
+        return self._orig_logging_name or "default"
+
+    def saturated(self) -> bool:
+        return self.checkedout() >= self.size() + max(0, self._max_overflow)
+
+    def _do_get(self):
+        label = self.label
+        max_waiters = POOL_MAX_WAITERS.get(label, 0)
+        with self._waiters_lock:
+            if max_waiters and self.waiting >= max_waiters and self.saturated():
+                DB_POOL_REJECTED.labels(pool=label, reason="waiters").inc()
+                raise PoolOverloaded(f"pool {label} exhausted, {self.waiting} requests already waiting")
+            self.waiting += 1
+        start = time.perf_counter()
+        try:
+            return super()._do_get()
+        except sa_exc.TimeoutError:
+            DB_POOL_REJECTED.labels(pool=label, reason="timeout").inc()
+            raise
+        finally:
+            DB_POOL_WAIT_SECONDS.labels(pool=label).observe(time.perf_counter() - start)
+            with self._waiters_lock:
+                self.waiting -= 1
+
+
+class InstrumentedQueuePool(_InstrumentedPoolMixin, QueuePool):
+    pass
+
+
+class InstrumentedAsyncQueuePool(_InstrumentedPoolMixin, AsyncAdaptedQueuePool):
+    pass
+
+
+def _create_engine(
+    pool_size: int,
+    max_overflow: int,
+    url: Optional[str] = None,
+    args: Optional[Dict[str, Any]] = None,
+    *,
+    pool_timeout: float = 60,
+    label: str = "default",
+):
+    return create_engine(
+        url or database_url,
+        connect_args=connect_args if args is None else args,
+        poolclass=InstrumentedQueuePool,
+        pool_logging_name=label,
+        pool_size=pool_size,
+        max_overflow=max_overflow,
+        pool_timeout=pool_timeout,
+        pool_recycle=3600,
+        pool_pre_ping=True,
+        echo=False,
+    )
+
+
+# Бюджет API: короткое ожидание пула, дальше — 503 (поллер и воркеры — со своими пулами и бюджетами)
+POOL_MAX_WAITERS.update({
+    "api": settings.db_pool_max_waiters,
+    "api_replica": settings.db_pool_max_waiters,
+    "api_async": settings.db_pool_max_waiters,
+})
+
+engine = _create_engine(
+    pool_size=settings.db_pool_size,
+    max_overflow=settings.db_max_overflow,
+    pool_timeout=settings.db_pool_timeout_seconds,
+    label="api",
 )
 
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 
 
+def create_session_factory(
+    pool_size: int,
+    max_overflow: int,
+    *,
+    pool_timeout: float = 60,
+    label: str = "background",
+) -> sessionmaker:
+    """Фабрика сессий с собственным пулом соединений (для фоновых контуров вне API)."""
+    bind = _create_engine(pool_size, max_overflow, pool_timeout=pool_timeout, label=label)
+    return sessionmaker(autocommit=False, autoflush=False, bind=bind)
+
+
 def get_db():
     db = SessionLocal()
     try:
@@ -79,3 +220,216 @@ def get_db():
         db.close()
 
 
+_replica_conn = _build_replica_conn() if settings.db_replica_enabled else None
+replica_engine: Optional[Engine] = (
+    _create_engine(
+        settings.db_replica_pool_size,
+        settings.db_replica_max_overflow,
+        *_replica_conn,
+        pool_timeout=settings.db_pool_timeout_seconds,
+        label="api_replica",
+    )
+    if _replica_conn
+    else None
+)
+
+# Задержка реплики: на реплике, догнавшей мастер (receive = replay), задержка 0, даже если записей давно не было
+_REPLICA_LAG_SQL = text(
+    "SELECT CASE WHEN NOT pg_is_in_recovery() THEN 0 "
+    "WHEN pg_last_wal_receive_lsn() = pg_last_wal_replay_lsn() THEN 0 "
+    "ELSE COALESCE(EXTRACT(EPOCH FROM now() - pg_last_xact_replay_timestamp()), 0) END"
+)
+
+
+class ReplicaLagGuard:
+    """Кэшируемая проверка отставания реплики: не чаще раза в DB_REPLICA_LAG_CHECK_SECONDS.
+
+    Пока отставание больше DB_REPLICA_MAX_LAG_SECONDS или реплика недоступна, чтения идут на мастер.
+    """
+
+    def __init__(self, engine: Engine, max_lag_seconds: float, check_interval_seconds: float) -> None:
+        self._engine = engine
+        self._max_lag = max_lag_seconds
+        self._interval = check_interval_seconds
+        self._lock = threading.Lock()
+        self._checked_at = 0.0
+        self._usable = False
+        self.lag_seconds: Optional[float] = None
+
+    def usable(self) -> bool:
+        now = time.monotonic()
+        if now - self._checked_at < self._interval:
+            return self._usable
+        with self._lock:
+            if now - self._checked_at >= self._interval:
+                self._usable = self._check()
+                self._checked_at = time.monotonic()
+        return self._usable
+
+    def _check(self) -> bool:
+        try:
+            with self._engine.connect() as conn:
+                self.lag_seconds = float(conn.execute(_REPLICA_LAG_SQL).scalar() or 0)
+        except Exception:
+            logger.warning("db.replica: unavailable, reading from primary", exc_info=True)
+            self.lag_seconds = None
+            return False
+        if self.lag_seconds > self._max_lag:
+            logger.warning("db.replica: lag %.1fs exceeds %.1fs, reading from primary", self.lag_seconds, self._max_lag)
+            return False
+        return True
+
+
+replica_guard: Optional[ReplicaLagGuard] = (
+    ReplicaLagGuard(replica_engine, settings.db_replica_max_lag_seconds, settings.db_replica_lag_check_seconds)
+    if replica_engine is not None
+    else None
+)
+
+
+class RoutingSession(Session):
+    """Сессия для read-only маршрутов: SELECT — на реплику, всё остальное — на мастер.
+
+    После первой записи (flush, UPDATE/INSERT, SELECT ... FOR UPDATE) сессия до конца
+    остаётся на мастере, чтобы читать собственные изменения.
+    """
+
+    def get_bind(self, mapper=None, clause=None, **kw):
+        if self.info.get("primary") or replica_guard is None:
+            return engine
+        if self._flushing or not isinstance(clause, Select) or clause._for_update_arg is not None:
+            self.info["primary"] = True
+            return engine
+        if not replica_guard.usable():
+            return engine
+        self.info["on_replica"] = True
+        return replica_engine
+
+
+ReadSessionLocal = sessionmaker(autocommit=False, autoflush=False, class_=RoutingSession)
+
+
+def get_read_db():
+    """Зависимость для read-only GET-эндпоинтов: чтение с реплики с фоллбэком на мастер.
+
+    Только для данных, которым допустимо отставание до DB_REPLICA_MAX_LAG_SECONDS. Баланс,
+    задачи и всё, что клиент перечитывает сразу после своей записи, читаются через get_db.
+    """
+    db = ReadSessionLocal()
+    try:
+        yield db
+    finally:
+        db.close()
+
+
+def retry_on_primary(db: Session) -> bool:
+    """Переключить сессию на мастер, если она читала с реплики (True — стоит повторить запрос).
+
+    Для «не найдено» сразу после создания записи: реплика могла ещё не получить её.
+    """
+    if not db.info.get("on_replica") or db.info.get("primary"):
+        return False
+    db.info["primary"] = True
+    return True
+
+
+# Параметры libpq, которые asyncpg принимает под другим именем или в другом виде (см. _build_async_conn)
+_LIBPQ_ASYNC_PARAMS = (
+    "host", "sslmode", "sslrootcert", "sslcert", "sslkey",
+    "target_session_attrs", "connect_timeout", "application_name",
+)
+# Параметры libpq без аналога в asyncpg: отбрасываются, иначе asyncpg.connect() падает с TypeError
+_LIBPQ_ONLY_PARAMS = (
+    "keepalives", "keepalives_idle", "keepalives_interval", "keepalives_count",
+    "sslcompression", "sslcrl", "gssencmode", "krbsrvname", "requiressl", "channel_binding", "options",
+)
+# Параметры диалекта asyncpg в SQLAlchemy, которые можно оставить в URL
+_ASYNCPG_URL_PARAMS = ("prepared_statement_cache_size",)
+
+
+def _build_async_conn(
+    sync_url: Optional[str] = None,
+    sync_args: Optional[Dict[str, Any]] = None,
+) -> Tuple[str, Dict[str, Any]]:
+    """URL и connect_args для asyncpg из тех же параметров, что у синхронного движка (libpq → asyncpg).
+
+    Параметры libpq берутся и из connect_args, и из query-строки DATABASE_URL (connect_args главнее):
+    известные переводятся (sslmode → ssl, application_name → server_settings, ...), остальные
+    убираются из URL — asyncpg получает их как именованные аргументы и не знает.
+    """
+    url = make_url(sync_url if sync_url is not None else database_url)
+    params: Dict[str, Any] = {}
+    passthrough: Dict[str, Any] = {}
+    for name, value in url.query.items():
+        value = value[-1] if isinstance(value, tuple) else value
+        if name in _LIBPQ_ASYNC_PARAMS:
+            params[name] = value
+        elif name in _ASYNCPG_URL_PARAMS:
+            passthrough[name] = value
+        elif name in _LIBPQ_ONLY_PARAMS:
+            logger.info("db.async: dropping libpq-only parameter %s from DATABASE_URL", name)
+        else:
+            logger.warning("db.async: unknown DATABASE_URL parameter %s is not passed to asyncpg", name)
+    params.update(connect_args if sync_args is None else sync_args)
+    url = url.set(drivername="postgresql+asyncpg", query=passthrough)
+
+    async_args: Dict[str, Any] = {}
+    sslmode = params.get("sslmode")
+    if sslmode and sslmode != "disable":
+        ctx = ssl.create_default_context(cafile=params.get("sslrootcert"))
+        if sslmode != "verify-full":
+            ctx.check_hostname = False
+        if sslmode in ("require", "prefer", "allow"):
+            ctx.verify_mode = ssl.CERT_NONE
+        if params.get("sslcert"):
+            ctx.load_cert_chain(params["sslcert"], params.get("sslkey"))
+        async_args["ssl"] = ctx
+    if params.get("host"):
+        async_args["host"] = str(params["host"]).split(",")
+    if params.get("target_session_attrs"):
+        async_args["target_session_attrs"] = params["target_session_attrs"]
+    if params.get("connect_timeout"):
+        async_args["timeout"] = float(params["connect_timeout"])
+    if params.get("application_name"):
+        async_args["server_settings"] = {"application_name": params["application_name"]}
+    return url.render_as_string(hide_password=False), async_args
+
+
+# Асинхронный движок создаётся при первом обращении: синхронные процессы (воркер, поллер) asyncpg не трогают
+_async_engine: Optional[AsyncEngine] = None
+
+AsyncSessionLocal = async_sessionmaker(autoflush=False, expire_on_commit=False)
+
+
+def get_async_engine() -> AsyncEngine:
+    global _async_engine
+    if _async_engine is None:
+        async_url, async_connect_args = _build_async_conn()
+        _async_engine = create_async_engine(
+            async_url,
+            connect_args=async_connect_args,
+            poolclass=InstrumentedAsyncQueuePool,
+            pool_logging_name="api_async",
+            pool_size=settings.async_db_pool_size,
+            max_overflow=settings.async_db_max_overflow,
+            pool_timeout=settings.db_pool_timeout_seconds,
+            pool_recycle=3600,
+            pool_pre_ping=True,
+            echo=False,
+        )
+        AsyncSessionLocal.configure(bind=_async_engine)
+    return _async_engine
+
+
+async def get_async_db() -> AsyncIterator[AsyncSession]:
+    """Зависимость для async def эндпоинтов: запросы к БД не блокируют событийный цикл."""
+    get_async_engine()
+    async with AsyncSessionLocal() as db:
+        yield db
+
+
+async def dispose_async_engine() -> None:
+    global _async_engine
+    if _async_engine is not None:
+        await _async_engine.dispose()
+        _async_engine = None
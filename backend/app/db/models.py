@@ -1,7 +1,7 @@
 from sqlalchemy import (
     Column, Text, Numeric, String, DateTime, ForeignKey,
     Boolean, Integer, JSON, func, Enum as SAEnum,
-    Index, UniqueConstraint, CheckConstraint
+    Index, UniqueConstraint, CheckConstraint, text
 )
 from sqlalchemy.dialects.postgresql import UUID, JSONB
 from sqlalchemy.ext.declarative import declarative_base
@@ -40,6 +40,8 @@ class User(Base):
     __table_args__ = (
         Index('ix_users_username', 'username'),
         Index('ix_users_referrer_id', 'referrer_id'),
+        # Ключ upsert'а в app.services.identity (INSERT ... ON CONFLICT (telegram_id))
+        Index('uq_users_telegram_id', 'telegram_id', unique=True),
     )
 
     id = Column(UUID(as_uuid=True), primary_key=True, default=default_uuid)
@@ -148,6 +150,12 @@ class Job(Base):
         Index('ix_jobs_request_id', 'request_id'),
         Index('ix_jobs_input_gin', 'input', postgresql_using='gin'),
         Index('ix_jobs_output_gin', 'output', postgresql_using='gin'),
+        # Очередь поллера: только активные оплаченные задачи, упорядоченные по времени следующей проверки
+        Index(
+            'ix_jobs_active_next_poll',
+            'next_poll_at',
+            postgresql_where=text("is_paid AND status IN ('queued', 'processing')"),
+        ),
         CheckConstraint('price_rub IS NULL OR price_rub >= 0', name='ck_jobs_price_nonneg'),
         CheckConstraint('tokens_reserved >= 0', name='ck_jobs_tokens_reserved_nonneg'),
         CheckConstraint('tokens_consumed >= 0', name='ck_jobs_tokens_consumed_nonneg'),
@@ -182,12 +190,18 @@ class Job(Base):
     output = Column(JSONB)   # list[IOObject]
     result_url = Column(Text)
     meta = Column(JSONB)
+    # Длительность этапов постобработки, мс: {"probe_ms", "transform_ms", "upload_ms", "thumbnail_upload_ms", "total_ms"}
+    postprocess_timings = Column(JSONB)
 
     # Вспомогательные данные
     payment_info = Column(JSONB)
     email_delivery_status = Column(Text, default="not_sent")
     is_ok = Column(Boolean, default=False)
     is_paid = Column(Boolean, default=False)
+    # Когда поллеру в следующий раз проверить статус в FAL (NULL — как можно скорее)
+    next_poll_at = Column(DateTime(timezone=True))
+    # Версия строки: увеличивается при каждой смене статуса (app.services.job_state.transition_job)
+    version = Column(Integer, nullable=False, default=1, server_default=text("1"))
 
     created_at = Column(DateTime(timezone=True), server_default=func.now())
     updated_at = Column(DateTime(timezone=True), server_default=func.now(), onupdate=func.now())
@@ -1,9 +1,10 @@
-from fastapi import FastAPI, APIRouter, Depends
+from fastapi import FastAPI, APIRouter, Depends, Request
 import logging
 import sys
 from starlette.middleware.sessions import SessionMiddleware
 from starlette.middleware.cors import CORSMiddleware
-from fastapi.responses import ORJSONResponse
+from fastapi.responses import ORJSONResponse, Response
+from sqlalchemy.exc import TimeoutError as PoolTimeoutError
 
 from app.core.config import settings
 from app.api.deps import require_api_key
@@ -38,6 +39,17 @@ app = FastAPI(
 
 app.add_middleware(SessionMiddleware, secret_key=settings.jwt_secret_key)
 
+
+# Пул БД исчерпан дольше бюджета ожидания — быстрый 503 вместо зависшего запроса
+@app.exception_handler(PoolTimeoutError)
+async def db_pool_overloaded(request: Request, exc: PoolTimeoutError) -> ORJSONResponse:
+    logging.getLogger("uvicorn.error").warning("db pool overloaded path=%s: %s", request.url.path, exc)
+    return ORJSONResponse(
+        status_code=503,
+        content={"detail": "Service is overloaded, retry later"},
+        headers={"Retry-After": str(settings.db_overload_retry_after_seconds)},
+    )
+
 # CORS
 cors_origins = [
     "http://https://xn--b1ahgb0aea5aq.online",
@@ -54,6 +66,8 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    # Keyset-пагинация и кэш страниц: браузеру нужны курсор и ETag из ответа
+    expose_headers=["ETag", "X-Next-Cursor"],
 )
 
 api_v1 = APIRouter(prefix="/api/v1")
@@ -82,22 +96,79 @@ def healthcheck() -> dict:
     return {"status": "ok", "env": settings.environment}
 
 
+# Скрейп Prometheus — с тем же X-API-Key, что и API (http_headers в scrape_config)
+@app.get("/metrics", include_in_schema=False, dependencies=[Depends(require_api_key)])
+def metrics() -> Response:
+    from app.services.metrics import render_metrics
+    body, content_type = render_metrics()
+    return Response(content=body, media_type=content_type)
+
+
+@app.on_event("startup")
+def register_metrics() -> None:
+    from app.services.metrics import register_pipeline_collector
+    register_pipeline_collector()
+
+
+@app.on_event("startup")
+def warmup_s3() -> None:
+    from app.services.s3 import warmup_s3_clients
+    try:
+        warmup_s3_clients()
+    except Exception:
+        logging.getLogger("uvicorn.error").exception("startup: s3 client warmup failed")
+
+
+@app.on_event("startup")
+def start_catalog_refresher() -> None:
+    from app.services.catalog import catalog
+    try:
+        catalog.refresh()
+    except Exception:
+        logging.getLogger("uvicorn.error").exception("startup: catalog preload failed")
+    catalog.start_refresher()
+
+
+@app.on_event("shutdown")
+def close_fal_http_client() -> None:
+    from app.services.fal_async import close_sync_fal_client
+    close_sync_fal_client()
+
+
+@app.on_event("shutdown")
+async def close_async_db() -> None:
+    from app.database import dispose_async_engine
+    await dispose_async_engine()
+
+
 # Фоновый поллинг очередь FAL (резервный контур на случай, если вебхук не пришёл)
 import threading
+from app.database import create_session_factory
 from app.services.fal_poller import run_poller
 
 
 @app.on_event("startup")
 def start_fal_poller() -> None:
     import logging
+    if not settings.fal_poller_in_process:
+        logging.getLogger("uvicorn.error").info("startup: in-process fal poller disabled")
+        return
     logging.getLogger("uvicorn.error").info(
         "startup: starting fal poller thread (interval=%ss)",
         settings.fal_poll_interval_seconds,
     )
+    # Свой пул и бюджет ожидания: поллер не отнимает соединения у запросов API
+    session_factory = create_session_factory(
+        pool_size=settings.fal_poller_db_pool_size,
+        max_overflow=settings.fal_poller_db_max_overflow,
+        pool_timeout=settings.fal_poller_db_pool_timeout_seconds,
+        label="poller",
+    )
     t = threading.Thread(
         target=run_poller,
         name="fal-poller",
         args=(int(settings.fal_poll_interval_seconds),),
+        kwargs={"session_factory": session_factory},
         daemon=True,
     )
     t.start()
@@ -0,0 +1,54 @@
+from __future__ import annotations
+
+import logging
+from decimal import Decimal
+from typing import Any, Optional
+
+from sqlalchemy import func, update
+from sqlalchemy.orm import Session
+
+from app.db.models import User
+
+
+logger = logging.getLogger(__name__)
+
+
+def reserve_tokens(db: Session, user_id: Any, amount: Decimal) -> Optional[Decimal]:
+    """Списать токены одним условным UPDATE, без чтения баланса и блокировок строки.
+
+    UPDATE users SET balance_tokens = balance_tokens - :n WHERE id=:id AND balance_tokens >= :n
+    RETURNING balance_tokens. Параллельные списания одного пользователя сериализует сама строка:
+    второе увидит уже уменьшенный баланс и не пройдёт условие, если средств не хватает.
+
+    Возвращает новый баланс или None, если средств недостаточно. Коммит — за вызывающим.
+    """
+    amount = Decimal(amount)
+    balance = func.coalesce(User.balance_tokens, 0)
+    stmt = (
+        update(User)
+        .where(User.id == user_id)
+        .where(balance >= amount)
+        .values(balance_tokens=balance - amount)
+        .returning(User.balance_tokens)
+        .execution_options(synchronize_session="fetch")
+    )
+    new_balance = db.execute(stmt).scalar_one_or_none()
+    if new_balance is None:
+        logger.info("balance: insufficient tokens user_id=%s needed=%s", user_id, amount)
+    return new_balance
+
+
+def credit_tokens(db: Session, user_id: Any, amount: Decimal) -> Optional[Decimal]:
+    """Начислить токены (возврат резерва, пополнение, бонус) атомарным UPDATE ... RETURNING.
+
+    Прибавление на стороне БД не затирает параллельное списание reserve_tokens.
+    Возвращает новый баланс или None, если пользователя нет. Коммит — за вызывающим.
+    """
+    stmt = (
+        update(User)
+        .where(User.id == user_id)
+        .values(balance_tokens=func.coalesce(User.balance_tokens, 0) + Decimal(amount))
+        .returning(User.balance_tokens)
+        .execution_options(synchronize_session="fetch")
+    )
+    return db.execute(stmt).scalar_one_or_none()
@@ -0,0 +1,267 @@
+from __future__ import annotations
+
+import logging
+import threading
+import time
+import uuid
+from itertools import chain
+from typing import Any, Dict, List, Optional
+
+import orjson
+from redis import Redis
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+
+from app.core.config import settings
+from app.database import SessionLocal
+from app.db.models import Category, Format, Model
+
+
+logger = logging.getLogger(__name__)
+
+# Сущности, изменение которых требует перечитать каталог
+_CATALOG_ENTITIES = (Model, Category, Format)
+
+
+def canonical_model_id(model_id: Any) -> Optional[str]:
+    """Канонический вид UUID модели (нижний регистр, с дефисами) или None, если это не UUID."""
+    try:
+        return str(uuid.UUID(str(model_id)))
+    except (TypeError, ValueError):
+        return None
+
+
+def serialize_model(m: Model) -> dict[str, Any]:
+    return {
+        "id": str(m.id),
+        "title": m.title,
+        "name": m.name,
+        "description": m.description,
+        "category_id": str(m.category_id) if m.category_id else None,
+        "cost_unit": m.cost_unit,
+        "cost_per_unit_tokens": float(m.cost_per_unit_tokens or 0),
+        "currency": m.currency,
+        "format_from": m.format_from,
+        "format_to": m.format_to,
+        "banner_image_url": m.banner_image_url,
+        "hint": m.hint,
+        "max_file_count": m.max_file_count,
+        "options": m.options,
+        "created_at": m.created_at.isoformat() if m.created_at else None,
+    }
+
+
+class CatalogSnapshot:
+    """Неизменяемый снимок каталога: ORM-объекты (detached), сериализация и индексы.
+
+    Снимок целиком заменяется при обновлении, поэтому читатели не нуждаются в блокировках.
+    """
+
+    def __init__(self, version: int, models: List[Model], categories: List[Category], formats: List[Format]) -> None:
+        self.version = version
+        self.loaded_at = time.monotonic()
+        # Порядок как в GET /models: новые сначала
+        self.models = sorted(models, key=lambda m: m.created_at.timestamp() if m.created_at else float("-inf"), reverse=True)
+        self.categories = categories
+        self.formats = formats
+
+        self.serialized: Dict[str, dict[str, Any]] = {}
+        self.json: Dict[str, bytes] = {}
+        self.by_id: Dict[str, Model] = {}
+        self.by_category: Dict[str, List[Model]] = {}
+        self.by_format_pair: Dict[tuple[str, str], List[Model]] = {}
+        self._position: Dict[str, int] = {}
+        for position, m in enumerate(self.models):
+            mid = str(m.id)
+            data = serialize_model(m)
+            self.serialized[mid] = data
+            self.json[mid] = orjson.dumps(data)
+            self.by_id[mid] = m
+            self._position[mid] = position
+            if m.category_id:
+                self.by_category.setdefault(str(m.category_id), []).append(m)
+            pair = ((m.format_from or "").strip().lower(), (m.format_to or "").strip().lower())
+            self.by_format_pair.setdefault(pair, []).append(m)
+
+    def model_by_id(self, model_id: Any) -> Optional[Model]:
+        key = canonical_model_id(model_id) if model_id else None
+        return self.by_id.get(key) if key else None
+
+    def search_models(
+        self,
+        q: Optional[str] = None,
+        category: Optional[str] = None,
+        format_from: Optional[str] = None,
+        format_to: Optional[str] = None,
+    ) -> List[Model]:
+        """Фильтрация с той же семантикой, что была в SQL: ILIKE-подстроки и точная категория."""
+        if format_from or format_to:
+            candidates = self._by_formats(format_from, format_to)
+            if category:
+                candidates = [m for m in candidates if str(m.category_id) == str(category)]
+        elif category:
+            candidates = self.by_category.get(str(category), [])
+        else:
+            candidates = self.models
+        if q:
+            needle = q.lower()
+            candidates = [m for m in candidates if needle in (m.title or "").lower() or needle in (m.name or "").lower()]
+        return candidates
+
+    def _by_formats(self, format_from: Optional[str], format_to: Optional[str]) -> List[Model]:
+        """Модели подходящих пар форматов из by_format_pair: подстрока проверяется по парам, а не по моделям."""
+        need_from = (format_from or "").lower()
+        need_to = (format_to or "").lower()
+        groups = [ms for (f, t), ms in self.by_format_pair.items() if need_from in f and need_to in t]
+        if len(groups) == 1:
+            return groups[0]
+        # Несколько пар — сохраняем общий порядок каталога (новые сначала)
+        return sorted(chain.from_iterable(groups), key=lambda m: self._position[str(m.id)])
+
+
+class Catalog:
+    """Версионированный кэш каталога в памяти процесса.
+
+    Обновляется фоновым потоком по таймеру или по сигналу инвалидации в Redis pub/sub.
+    Без фонового потока (RQ-воркеры, скрипты) снимок перечитывается при обращении, если устарел.
+    """
+
+    def __init__(self) -> None:
+        self._snapshot: Optional[CatalogSnapshot] = None
+        self._lock = threading.Lock()
+        self._version = 0
+        self._refresher: Optional[threading.Thread] = None
+        self._stale = False
+
+    def invalidate(self) -> None:
+        """Пометить снимок устаревшим в этом процессе: следующее обращение перечитает каталог."""
+        self._stale = True
+
+    def refresh(self) -> CatalogSnapshot:
+        start_ts = time.perf_counter()
+        db = SessionLocal()
+        try:
+            models = db.query(Model).all()
+            categories = db.query(Category).all()
+            formats = db.query(Format).all()
+            # Отвязываем объекты от сессии: все колонки уже загружены и читаются без БД
+            db.expunge_all()
+        finally:
+            db.close()
+        with self._lock:
+            self._stale = False
+            self._version += 1
+            snapshot = CatalogSnapshot(self._version, models, categories, formats)
+            self._snapshot = snapshot
+        logger.info(
+            "catalog: refreshed version=%s models=%s categories=%s formats=%s elapsed_ms=%s",
+            snapshot.version,
+            len(models),
+            len(categories),
+            len(formats),
+            int((time.perf_counter() - start_ts) * 1000),
+        )
+        return snapshot
+
+    def get(self) -> CatalogSnapshot:
+        snapshot = self._snapshot
+        if snapshot is None:
+            return self.refresh()
+        expired = self._refresher is None and time.monotonic() - snapshot.loaded_at > settings.catalog_refresh_seconds
+        if self._stale or expired:
+            try:
+                return self.refresh()
+            except Exception:
+                logger.exception("catalog: refresh failed, serving stale version=%s", snapshot.version)
+        return snapshot
+
+    def refresh_if_model_exists(self, model_id: str) -> Optional[CatalogSnapshot]:
+        """Промах снимка по id: модель могла появиться после последнего обновления.
+
+        Перечитывает каталог, только если модель есть в БД, — запросы несуществующих id
+        не вызывают полную перезагрузку.
+        """
+        db = SessionLocal()
+        try:
+            exists = db.query(Model.id).filter(Model.id == model_id).first() is not None
+        finally:
+            db.close()
+        if not exists:
+            return None
+        logger.info("catalog: model %s missing in snapshot version=%s, refreshing", model_id, self._snapshot.version if self._snapshot else None)
+        return self.refresh()
+
+    def start_refresher(self) -> None:
+        if self._refresher is not None:
+            return
+        self._refresher = threading.Thread(target=self._refresh_loop, name="catalog-refresher", daemon=True)
+        self._refresher.start()
+
+    def _refresh_loop(self) -> None:
+        pubsub = None
+        while True:
+            try:
+                if pubsub is None:
+                    pubsub = Redis.from_url(settings.redis_url).pubsub(ignore_subscribe_messages=True)
+                    pubsub.subscribe(settings.catalog_invalidation_channel)
+                    logger.info("catalog: subscribed to %s", settings.catalog_invalidation_channel)
+            except Exception:
+                logger.warning("catalog: redis pub/sub unavailable, timer-only refresh")
+                pubsub = None
+            deadline = time.monotonic() + settings.catalog_refresh_seconds
+            invalidated = False
+            while time.monotonic() < deadline and not invalidated:
+                if pubsub is None:
+                    time.sleep(max(0.0, deadline - time.monotonic()))
+                    break
+                try:
+                    message = pubsub.get_message(timeout=min(5.0, max(0.1, deadline - time.monotonic())))
+                except Exception:
+                    logger.warning("catalog: redis pub/sub connection lost")
+                    pubsub = None
+                    continue
+                if message and message.get("type") == "message":
+                    invalidated = True
+            try:
+                self.refresh()
+            except Exception:
+                logger.exception("catalog: refresh failed")
+
+
+catalog = Catalog()
+
+
+def get_catalog() -> CatalogSnapshot:
+    return catalog.get()
+
+
+def publish_catalog_invalidation() -> None:
+    """Попросить все процессы перечитать каталог (после изменения моделей/категорий/форматов)."""
+    Redis.from_url(settings.redis_url).publish(settings.catalog_invalidation_channel, b"1")
+
+
+# Любой ORM-коммит, затронувший модели/категории/форматы, инвалидирует каталог во всех процессах
+@event.listens_for(Session, "before_flush")
+def _mark_catalog_changes(session: Session, flush_context, instances) -> None:
+    if any(isinstance(obj, _CATALOG_ENTITIES) for obj in chain(session.new, session.dirty, session.deleted)):
+        session.info["catalog_changed"] = True
+
+
+@event.listens_for(Session, "after_commit")
+def _publish_catalog_changes(session: Session) -> None:
+    if not session.info.pop("catalog_changed", False):
+        return
+    catalog.invalidate()
+    try:
+        publish_catalog_invalidation()
+    except Exception:
+        logger.exception("catalog: failed to publish invalidation")
+
+
+@event.listens_for(Session, "after_rollback")
+def _discard_catalog_changes(session: Session) -> None:
+    session.info.pop("catalog_changed", None)
+
+
+if __name__ == "__main__":
+    publish_catalog_invalidation()
@@ -4,6 +4,7 @@ import requests
 import logging
 import json as _json
 import time
+from urllib.parse import urlencode
 
 # fal_client может отсутствовать в окружении контейнера; делаем импорт опциональным
 try:
@@ -14,7 +15,9 @@ except ImportError:
 from app.core.config import settings
 
 # Утилиты S3 (пресайн ссылок)
-from app.services.s3_utils import parse_s3_url, get_file_url_with_expiry
+from app.services.s3_utils import parse_s3_url, get_file_url_with_expiry, upload_stream
+from app.services.metrics import observe_fal_request, observe_media_transfer
+from app.services.fal_async import submit_sync
 
 
 logger = logging.getLogger("livephoto.fal")
@@ -75,6 +78,17 @@ def generate_from_url(image_url: str, prompt: str, sync_mode: bool = True) -> Di
 	return result
 
 
+def fal_webhook_url(order_id: str, item_index: int) -> Optional[str]:
+	"""URL нашего вебхука /fal/webhook для задачи (None, если публичный адрес API не задан или вебхуки выключены)."""
+	base_url = settings.public_api_base_url or settings.backend_public_base_url
+	if not settings.fal_webhook_enabled or not base_url:
+		return None
+	params = {"order_id": order_id, "item_index": item_index}
+	if settings.fal_webhook_token:
+		params["token"] = settings.fal_webhook_token
+	return f"{base_url.rstrip('/')}/fal/webhook?{urlencode(params)}"
+
+
 def submit_generation(
     image_url: Optional[str],
     prompt: str,
@@ -87,8 +101,8 @@ def submit_generation(
 	"""Поставить задачу в очередь fal.ai с вебхуком и вернуть request_id.
 
 	Идемпотентность обеспечиваем на уровне нашего заказа (не запускаем повторно, если есть request_id).
+	Если публичный адрес API не задан, задача отправляется без вебхука и статус обновляет только поллер.
 	"""
-	# Вариант без вебхука: статус будет обновляться только поллером
 
 	# Входные параметры (безопасное логирование)
 	try:
@@ -118,10 +132,7 @@ def submit_generation(
 		logger.exception("submit_generation: error while presigning image_url")
 		raise
 
-	# Используем официальный fal-client для постановки в очередь
-	if fal_client is None:
-		logger.error("submit_generation: fal_client is None; cannot submit")
-		raise RuntimeError("fal-client не установлен в контейнере. Установите 'fal-client'.")
+	# Постановка в очередь — через общий пул httpx (AsyncFalClient), без нового соединения на вызов
 	use_endpoint = endpoint or settings.fal_endpoint
 	logger.info(f"submit_generation: using endpoint {use_endpoint}")
 	arguments: Dict[str, Any] = {}
@@ -145,40 +156,22 @@ def submit_generation(
 			mask_arguments["prompt"] = f"<len={len(str(mask_arguments['prompt']))}>"
 		except Exception:
 			mask_arguments["prompt"] = "<len=? >"
+	webhook_url = fal_webhook_url(order_id, item_index)
 	logger.info(
-		f"fal.sdk submit model={use_endpoint} args={_json.dumps(mask_arguments)[:2000]}"
+		f"fal.queue submit model={use_endpoint} webhook={'set' if webhook_url else 'none'} args={_json.dumps(mask_arguments)[:2000]}"
 	)
 	try:
 		submit_ts = time.perf_counter()
-		handler = fal_client.submit(use_endpoint, arguments=arguments)
+		submitted = submit_sync(use_endpoint, arguments, webhook_url=webhook_url)
 		elapsed_ms = int((time.perf_counter() - submit_ts) * 1000)
-		# Снимем безопасные поля из handler (если есть)
-		safe_info: Dict[str, Any] = {}
-		for attr in ("request_id", "status", "response_url", "queue_position"):
-			try:
-				val = getattr(handler, attr, None)
-				if val is not None:
-					safe_info[attr] = val
-			except Exception:
-				continue
-		handler_type = getattr(handler, "__class__", type(handler)).__name__
-		logger.info(f"fal.sdk submit -> elapsed_ms={elapsed_ms} handler_type={handler_type} info={safe_info}")
+		logger.info(f"fal.queue submit -> elapsed_ms={elapsed_ms} request_id={submitted.get('request_id')}")
 	except Exception:
-		logger.exception("submit_generation: fal_client.submit raised")
+		logger.exception("submit_generation: fal queue submit raised")
 		raise
-	request_id = getattr(handler, "request_id", None)
-	if not request_id:
-		try:
-			handler_type = getattr(handler, "__class__", type(handler)).__name__
-			handler_repr = str(handler)
-		except Exception:
-			handler_type = handler_type if 'handler_type' in locals() else "<unknown>"
-			handler_repr = "<unrepr>"
-		logger.error(f"fal-client: request_id not returned by submit; handler_type={handler_type} handler_repr={handler_repr[:1000]}")
-		raise ValueError("fal-client: request_id not returned by submit")
+	request_id = submitted["request_id"]
 	total_ms = int((time.perf_counter() - start_ts) * 1000)
 	logger.info(f"submit_generation: return request_id={request_id} model_id={use_endpoint} total_ms={total_ms}")
-	return {"request_id": request_id, "model_id": use_endpoint}
+	return {"request_id": request_id, "model_id": use_endpoint, "webhook": bool(webhook_url)}
 
 
 def get_request_status(request_id: str, logs: bool = False, model_id: str | None = None) -> Dict[str, Any]:
@@ -189,7 +182,8 @@ def get_request_status(request_id: str, logs: bool = False, model_id: str | None
 	logger.info(
 		f"fal.sdk status model={model_path} request_id={request_id} with_logs={logs}"
 	)
-	data = fal_client.status(model_path, request_id, with_logs=logs)
+	with observe_fal_request("status", model_path):
+		data = fal_client.status(model_path, request_id, with_logs=logs)
 	# Безопасное логирование (fal-client может возвращать несериализуемые объекты, напр. InProgress)
 	try:
 		log_str = _json.dumps(data)[:2000]  # type: ignore[arg-type]
@@ -214,6 +208,8 @@ def get_request_status(request_id: str, logs: bool = False, model_id: str | None
 				status_norm = "FAILED"
 			elif "CANCELLED" in cls_name or "CANCELED" in cls_name:
 				status_norm = "CANCELLED"
+			elif "QUEUED" in cls_name:
+				status_norm = "IN_QUEUE"
 			else:
 				status_norm = "IN_PROGRESS"
 	except Exception:
@@ -227,6 +223,10 @@ def get_request_status(request_id: str, logs: bool = False, model_id: str | None
 				resp[fld] = val
 		except Exception:
 			continue
+	# Позиция в очереди FAL (есть только у Queued) — используется планировщиком поллера
+	position = getattr(data, "position", None)
+	if isinstance(position, int):
+		resp["queue_position"] = position
 	return resp
 
 
@@ -238,7 +238,8 @@ def get_request_response(request_id: str, model_id: str | None = None) -> Dict[s
 	logger.info(
 		f"fal.sdk result model={model_path} request_id={request_id}"
 	)
-	data = fal_client.result(model_path, request_id)
+	with observe_fal_request("result", model_path):
+		data = fal_client.result(model_path, request_id)
 	try:
 		log_str = _json.dumps(data)[:2000]
 	except TypeError:
@@ -328,3 +329,30 @@ def fetch_bytes(url: str, headers: Optional[Dict[str, str]] = None, timeout: int
 	content_len = resp.headers.get("Content-Length") or len(resp.content)
 	logger.info(f"fal.http <- {resp.status_code} bytes={content_len}")
 	return resp.content
+
+
+def stream_to_s3(
+	url: str,
+	bucket: str,
+	key: str,
+	content_type: Optional[str] = None,
+	headers: Optional[Dict[str, str]] = None,
+	timeout: int = 180,
+	chunk_size: int = 1024 * 1024,
+) -> int:
+	"""Перекачать файл по URL прямо в S3 (multipart), не держа его целиком в памяти.
+
+	Возвращает количество переданных байт.
+	"""
+	mask_headers = dict(headers or {})
+	if "Authorization" in mask_headers:
+		mask_headers["Authorization"] = "****"
+	logger.info(f"fal.http GET (stream) {url} headers={mask_headers} -> s3://{bucket}/{key}")
+	start_ts = time.perf_counter()
+	with requests.get(url, headers=headers, timeout=timeout, stream=True) as resp:
+		resp.raise_for_status()
+		total = upload_stream(bucket, key, resp.iter_content(chunk_size=chunk_size), content_type=content_type)
+	elapsed = time.perf_counter() - start_ts
+	observe_media_transfer("fal_to_s3", total, elapsed)
+	logger.info(f"fal.http <- {resp.status_code} streamed bytes={total} elapsed_ms={int(elapsed * 1000)}")
+	return total
@@ -0,0 +1,233 @@
+"""Асинхронный клиент очереди fal.ai (queue.fal.run) поверх общего пула httpx.
+
+В отличие от обёрток над fal_client в app.services.fal, не открывает новое соединение на каждый
+вызов и не блокирует поток: один AsyncClient (HTTP/2, keep-alive) на процесс/событийный цикл,
+таймауты на каждый вызов и повторы с экспоненциальной паузой на 429/5xx и сетевых ошибках.
+Форма ответов совпадает с submit_generation/get_request_status/get_request_response.
+Синхронный код (RQ-воркер отправки) вызывает клиент через submit_sync: один фоновый цикл на процесс.
+"""
+from typing import Any, Dict, Optional
+import asyncio
+import json as _json
+import logging
+import os
+import random
+import threading
+import time
+from urllib.parse import urlencode
+
+import httpx
+
+from app.core.config import settings
+from app.services.metrics import observe_fal_request
+
+
+logger = logging.getLogger("livephoto.fal")
+
+# Пространства имён FAL, у которых app_id состоит из трёх сегментов (как в fal_client.AppId)
+_APP_NAMESPACES = ("workflows", "comfy")
+_RETRY_STATUSES = {429, 500, 502, 503, 504}
+# Для неидемпотентных вызовов (submit): повторяем только то, что FAL гарантированно не принял
+_SAFE_RETRY_STATUSES = {429}
+_SAFE_RETRY_ERRORS = (httpx.ConnectError, httpx.ConnectTimeout, httpx.PoolTimeout)
+
+
+def _http2_available() -> bool:
+	try:
+		import h2  # type: ignore  # noqa: F401
+	except ImportError:
+		return False
+	return True
+
+
+def _requests_base(endpoint: str) -> str:
+	"""Префикс /requests/ для эндпоинта: подпуть модели в URL статуса/результата не участвует."""
+	parts = endpoint.strip("/").split("/")
+	size = 3 if parts and parts[0] in _APP_NAMESPACES else 2
+	if len(parts) < size:
+		raise ValueError(f"invalid fal endpoint: {endpoint}")
+	return "/".join(parts[:size])
+
+
+def _retry_delay(attempt: int, response: Optional[httpx.Response]) -> float:
+	if response is not None:
+		retry_after = response.headers.get("Retry-After")
+		if retry_after:
+			try:
+				return min(float(retry_after), settings.fal_http_backoff_max_seconds)
+			except ValueError:
+				pass
+	base = settings.fal_http_backoff_seconds * (2 ** attempt)
+	return min(base, settings.fal_http_backoff_max_seconds) * (0.5 + random.random() / 2)
+
+
+class AsyncFalClient:
+	"""Клиент очереди FAL. Экземпляр привязан к событийному циклу, в котором впервые использован."""
+
+	def __init__(self, base_url: Optional[str] = None, key: Optional[str] = None) -> None:
+		self._base_url = (base_url or settings.fal_queue_base_url).rstrip("/")
+		self._key = key or settings.fal_key
+		self._client: Optional[httpx.AsyncClient] = None
+
+	def _http(self) -> httpx.AsyncClient:
+		if self._client is None:
+			http2 = bool(settings.fal_http2)
+			if http2 and not _http2_available():
+				logger.warning("fal.async: h2 package is not installed, falling back to HTTP/1.1")
+				http2 = False
+			self._client = httpx.AsyncClient(
+				http2=http2,
+				headers={"Authorization": f"Key {self._key}"} if self._key else {},
+				timeout=httpx.Timeout(
+					settings.fal_http_timeout_seconds,
+					connect=settings.fal_http_connect_timeout_seconds,
+				),
+				limits=httpx.Limits(
+					max_connections=settings.fal_http_max_connections,
+					max_keepalive_connections=settings.fal_http_max_keepalive_connections,
+				),
+			)
+		return self._client
+
+	async def aclose(self) -> None:
+		if self._client is not None:
+			await self._client.aclose()
+			self._client = None
+
+	async def _request(
+		self,
+		method: str,
+		url: str,
+		*,
+		json: Any = None,
+		params: Optional[Dict[str, Any]] = None,
+		timeout: Optional[float] = None,
+		idempotent: bool = True,
+	) -> Any:
+		"""HTTP-вызов с повторами на 429/5xx и сетевых ошибках; возвращает JSON тела ответа.
+
+		idempotent=False — повторы только на 429 и ошибках установки соединения,
+		чтобы не поставить одну задачу в очередь FAL дважды.
+		"""
+		client = self._http()
+		retry_statuses = _RETRY_STATUSES if idempotent else _SAFE_RETRY_STATUSES
+		retry_errors = httpx.TransportError if idempotent else _SAFE_RETRY_ERRORS
+		request_timeout = timeout if timeout is not None else httpx.USE_CLIENT_DEFAULT
+		max_retries = max(0, int(settings.fal_http_max_retries))
+		attempt = 0
+		while True:
+			start_ts = time.perf_counter()
+			response: Optional[httpx.Response] = None
+			try:
+				response = await client.request(method, url, json=json, params=params, timeout=request_timeout)
+			except retry_errors as e:
+				if attempt >= max_retries:
+					raise
+				delay = _retry_delay(attempt, None)
+				logger.warning(f"fal.async {method} {url} transport error={e!r}, retry in {delay:.2f}s")
+			else:
+				elapsed_ms = int((time.perf_counter() - start_ts) * 1000)
+				if response.status_code not in retry_statuses or attempt >= max_retries:
+					logger.info(f"fal.async {method} {url} <- {response.status_code} elapsed_ms={elapsed_ms}")
+					response.raise_for_status()
+					return response.json()
+				delay = _retry_delay(attempt, response)
+				logger.warning(f"fal.async {method} {url} <- {response.status_code}, retry in {delay:.2f}s")
+			attempt += 1
+			await asyncio.sleep(delay)
+
+	async def submit(
+		self,
+		endpoint: str,
+		arguments: Dict[str, Any],
+		webhook_url: Optional[str] = None,
+		timeout: Optional[float] = None,
+	) -> Dict[str, Any]:
+		"""Поставить задачу в очередь; возвращает {"request_id", "model_id"} как submit_generation."""
+		url = f"{self._base_url}/{endpoint.strip('/')}"
+		if webhook_url:
+			url += "?" + urlencode({"fal_webhook": webhook_url})
+		with observe_fal_request("submit", endpoint):
+			data = await self._request("POST", url, json=arguments, timeout=timeout, idempotent=False)
+		request_id = data.get("request_id") if isinstance(data, dict) else None
+		if not request_id:
+			raise ValueError(f"fal.async: request_id not returned by submit body={_json.dumps(data)[:1000]}")
+		return {"request_id": request_id, "model_id": endpoint}
+
+	async def status(
+		self,
+		request_id: str,
+		model_id: Optional[str] = None,
+		logs: bool = False,
+		timeout: Optional[float] = None,
+	) -> Dict[str, Any]:
+		"""Статус задачи: {"status": IN_QUEUE|IN_PROGRESS|COMPLETED, "queue_position"?, ...}."""
+		endpoint = model_id or settings.fal_endpoint or ""
+		url = f"{self._base_url}/{_requests_base(endpoint)}/requests/{request_id}/status"
+		with observe_fal_request("status", endpoint):
+			data = await self._request("GET", url, params={"logs": int(bool(logs))}, timeout=timeout)
+		if not isinstance(data, dict):
+			return {"status": "IN_PROGRESS"}
+		data["status"] = str(data.get("status") or "IN_PROGRESS").upper()
+		return data
+
+	async def result(
+		self,
+		request_id: str,
+		model_id: Optional[str] = None,
+		timeout: Optional[float] = None,
+	) -> Dict[str, Any]:
+		"""Результат завершённой задачи."""
+		endpoint = model_id or settings.fal_endpoint or ""
+		url = f"{self._base_url}/{_requests_base(endpoint)}/requests/{request_id}"
+		with observe_fal_request("result", endpoint):
+			data = await self._request("GET", url, timeout=timeout)
+		if isinstance(data, dict):
+			return data
+		return {"response": data}
+
+
+# Фоновый событийный цикл для синхронных вызывающих: клиент и его пул соединений живут,
+# пока жив процесс, а не пересоздаются на каждый asyncio.run()
+_sync_lock = threading.Lock()
+_sync_pid: Optional[int] = None
+_sync_loop: Optional[asyncio.AbstractEventLoop] = None
+_sync_client: Optional[AsyncFalClient] = None
+
+
+def _sync_runtime() -> tuple[asyncio.AbstractEventLoop, AsyncFalClient]:
+	global _sync_pid, _sync_loop, _sync_client
+	with _sync_lock:
+		# После fork (рабочий процесс RQ) поток цикла родителя не существует — создаём свой
+		if _sync_loop is None or _sync_pid != os.getpid():
+			loop = asyncio.new_event_loop()
+			threading.Thread(target=loop.run_forever, name="fal-async-loop", daemon=True).start()
+			_sync_pid, _sync_loop, _sync_client = os.getpid(), loop, AsyncFalClient()
+		return _sync_loop, _sync_client
+
+
+def submit_sync(
+	endpoint: str,
+	arguments: Dict[str, Any],
+	webhook_url: Optional[str] = None,
+	timeout: Optional[float] = None,
+) -> Dict[str, Any]:
+	"""AsyncFalClient.submit для синхронного кода (RQ-воркер, инлайн-отправка из API)."""
+	loop, client = _sync_runtime()
+	future = asyncio.run_coroutine_threadsafe(client.submit(endpoint, arguments, webhook_url, timeout), loop)
+	return future.result()
+
+
+def close_sync_fal_client() -> None:
+	"""Закрыть клиент и остановить фоновый цикл (shutdown API)."""
+	global _sync_pid, _sync_loop, _sync_client
+	with _sync_lock:
+		loop, client = _sync_loop, _sync_client
+		_sync_pid, _sync_loop, _sync_client = None, None, None
+	if loop is None or client is None:
+		return
+	try:
+		asyncio.run_coroutine_threadsafe(client.aclose(), loop).result(timeout=5)
+	except Exception:
+		logger.exception("fal.async: failed to close http client")
+	loop.call_soon_threadsafe(loop.stop)
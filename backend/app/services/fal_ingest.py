@@ -0,0 +1,152 @@
+from __future__ import annotations
+
+import logging
+from typing import Any, Dict, Optional
+
+from rq import Retry, get_current_job
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.core.config import settings
+from app.database import SessionLocal
+from app.db.models import Job, Model, WebhookLog
+from app.services.fal import extract_media_url
+from app.services.job_completion import FINAL_JOB_STATUSES, complete_job, completion_guard, fail_job
+from app.services.queue import get_queue
+
+
+logger = logging.getLogger(__name__)
+
+FAL_WEBHOOK_EVENT = "fal:webhook"
+_COMPLETED_STATUSES = ("ok", "succeeded", "completed", "completed_successfully")
+_FAILED_STATUSES = ("failed", "error")
+
+
+async def record_fal_webhook(db: AsyncSession, order_id: Optional[str], item_index: Optional[str], payload: Dict[str, Any]) -> str:
+    """Сохранить событие вебхука FAL в webhook_logs (до любой обработки) и вернуть его id."""
+    log = WebhookLog(
+        event_type=FAL_WEBHOOK_EVENT,
+        payload={"order_id": order_id, "item_index": item_index, "body": payload},
+        processed=False,
+    )
+    db.add(log)
+    await db.commit()
+    return str(log.id)
+
+
+def enqueue_fal_ingest(log_id: str) -> None:
+    """Поставить обработку события вебхука в очередь RQ.
+
+    Если Redis недоступен, событие остаётся в webhook_logs с processed=false,
+    а задачу в любом случае завершит поллер.
+    """
+    try:
+        get_queue(settings.fal_ingest_queue_name).enqueue(
+            ingest_fal_webhook,
+            log_id,
+            job_id=f"fal-ingest-{log_id}",
+            retry=Retry(max=settings.fal_ingest_max_retries, interval=list(settings.fal_ingest_retry_intervals)),
+            job_timeout=settings.fal_ingest_job_timeout_seconds,
+            result_ttl=3600,
+            failure_ttl=7 * 24 * 3600,
+        )
+        logger.info("fal.ingest: enqueued log_id=%s queue=%s", log_id, settings.fal_ingest_queue_name)
+    except Exception:
+        logger.exception("fal.ingest: enqueue failed log_id=%s", log_id)
+
+
+def _is_final_attempt() -> bool:
+    current = get_current_job()
+    if current is None:
+        return True
+    return not current.retries_left
+
+
+def _mark_processed(db, log: WebhookLog) -> None:
+    log.processed = True
+    db.commit()
+
+
+def _webhook_result(payload: Dict[str, Any]) -> tuple[str, Optional[str]]:
+    """Статус события ("completed" | "failed" | прочее) и URL результата.
+
+    Вебхук FAL присылает {"status": "OK"|"ERROR", "payload": {...результат модели...}};
+    поддерживаем и прежний формат со status=completed/succeeded и URL в корне.
+    """
+    status = str(payload.get("status") or payload.get("state") or "").lower()
+    if status in _COMPLETED_STATUSES:
+        status = "completed"
+    elif status in _FAILED_STATUSES:
+        status = "failed"
+    result = payload.get("payload")
+    media_url = extract_media_url({"response": result}) if isinstance(result, dict) else None
+    media_url = media_url or extract_media_url(payload) or payload.get("url") or payload.get("video_url")
+    return status, media_url if isinstance(media_url, str) and media_url else None
+
+
+def ingest_fal_webhook(log_id: str) -> None:
+    """RQ-задача: применить событие вебхука FAL к задаче (загрузка результата в S3, статус, уведомления)."""
+    db = SessionLocal()
+    try:
+        log = db.query(WebhookLog).filter(WebhookLog.id == log_id).first()
+        if not log or log.processed:
+            return
+        event = log.payload or {}
+        payload = event.get("body") or {}
+        order_id = event.get("order_id")
+        if not order_id:
+            _mark_processed(db, log)
+            return
+
+        job = db.query(Job).filter(Job.order_id == order_id).first()
+        if not job or job.status in FINAL_JOB_STATUSES:
+            # Задачу уже завершил поллер или предыдущая доставка вебхука
+            _mark_processed(db, log)
+            return
+
+        status, media_url = _webhook_result(payload)
+        if status == "completed" and not media_url:
+            # Результат не поместился в вебхук (payload_error) или без URL — поллер заберёт его сразу
+            logger.warning("fal.ingest: no media url in webhook, handing over to poller order_id=%s", order_id)
+            # Отдельным UPDATE без сдвига updated_at (на нём строится ETag списка задач)
+            db.query(Job).filter(Job.id == job.id).update(
+                {Job.next_poll_at: None, Job.updated_at: Job.updated_at},
+                synchronize_session=False,
+            )
+            _mark_processed(db, log)
+            return
+        if status not in ("completed", "failed"):
+            _mark_processed(db, log)
+            return
+        with completion_guard(job.id, source="webhook") as acquired:
+            if not acquired:
+                # Задачу сейчас завершает поллер
+                _mark_processed(db, log)
+                return
+            db.refresh(job)
+            if job.status in FINAL_JOB_STATUSES:
+                _mark_processed(db, log)
+                return
+            if status == "failed":
+                log.processed = True
+                fail_job(db, job, source="webhook", message=str(payload.get("error") or "")[:500] or None)
+            else:
+                _store_result(db, log, job, media_url)
+        logger.info("fal.ingest: processed log_id=%s order_id=%s status=%s", log_id, order_id, status)
+    finally:
+        db.close()
+
+
+def _store_result(db, log: WebhookLog, job: Job, media_url: str) -> None:
+    format_to = db.query(Model.format_to).filter(Model.id == job.model_id).scalar() if job.model_id else None
+    format_to = (format_to or "").strip().lower() or None
+    try:
+        log.processed = True
+        complete_job(db, job, media_url, format_to, source="webhook")
+    except Exception:
+        db.rollback()
+        if not _is_final_attempt():
+            logger.warning("fal.ingest: store media failed, will retry order_id=%s", job.order_id)
+            raise
+        logger.exception("fal.ingest: failed to store media for order_id=%s", job.order_id)
+        log.processed = True
+        fail_job(db, job, source="webhook", message="store media failed")
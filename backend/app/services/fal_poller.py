@@ -1,24 +1,136 @@
 from __future__ import annotations
 
+import asyncio
 import logging
+import signal
+import sys
+import threading
 import time
-from typing import Optional
+from datetime import datetime, timedelta, timezone
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import ExitStack
+from functools import partial
+from typing import Any, Callable, Dict, Optional
 
-from sqlalchemy.orm import Session
+from sqlalchemy import DateTime, String, Text, and_, case, cast, column, func, or_, select, update, values
+from sqlalchemy.dialects.postgresql import UUID as PG_UUID
+from sqlalchemy.orm import Session, sessionmaker
 
-from app.database import SessionLocal
+from app.database import SessionLocal, create_session_factory
 from app.db.models import Job, Model
-from app.services.fal import get_request_status, get_request_response, extract_media_url, fetch_bytes
-from app.services.s3_utils import s3_key_for_video, upload_bytes, get_file_url_with_expiry
+from app.services.fal import extract_media_url
+from app.services.fal_async import AsyncFalClient
+from app.services.metrics import POLL_JOBS_CHECKED, POLL_TICK_SECONDS
+from app.services.job_state import SOURCES_BY_TARGET
+from app.services.job_completion import (
+    FINAL_JOB_STATUSES,
+    STORE_RESULT_TIMEOUT_SECONDS,
+    announce_completion,
+    announce_failure,
+    completion_guard,
+    store_result,
+)
 from app.core.config import settings
-from app.services.telegram_service import notify_job_event
-from app.services.email_service import send_email_with_links
 
 
 # Используем uvicorn.error, чтобы гарантировать попадание в стандартные логи сервера
 logger = logging.getLogger("uvicorn.error")
 
 
+class EndpointRateLimiter:
+    """Ограничитель частоты запросов к FAL с отдельным лимитом на каждый эндпоинт.
+
+    rps <= 0 отключает ограничение для эндпоинта.
+    """
+
+    def __init__(self, default_rps: float, overrides: Optional[Dict[str, float]] = None) -> None:
+        self._default_rps = float(default_rps or 0)
+        self._overrides = dict(overrides or {})
+        self._next_slot: Dict[str, float] = {}
+        self._lock = threading.Lock()
+
+    def _reserve(self, endpoint: str) -> float:
+        """Занять ближайший слот эндпоинта; возвращает, сколько секунд до него ждать."""
+        rps = float(self._overrides.get(endpoint, self._default_rps) or 0)
+        if rps <= 0:
+            return 0.0
+        with self._lock:
+            now = time.monotonic()
+            slot = max(now, self._next_slot.get(endpoint, now))
+            self._next_slot[endpoint] = slot + 1.0 / rps
+        return slot - now
+
+    async def acquire_async(self, endpoint: str) -> None:
+        delay = self._reserve(endpoint)
+        if delay > 0:
+            await asyncio.sleep(delay)
+
+
+class PollScheduler:
+    """Адаптивное расписание проверок статуса задачи в FAL.
+
+    Задержка до следующей проверки зависит от последнего статуса и позиции в очереди FAL,
+    возраста задачи и типичного времени генерации модели: пока задача заведомо не готова,
+    её не опрашиваем; после ожидаемого срока проверяем часто, но не реже max_overdue_delay.
+    Задачи, отправленные с вебхуком, проверяются редко — только если вебхук запаздывает.
+    Типичное время берётся из Model.options.typical_runtime_seconds, иначе из скользящего
+    среднего наблюдённых длительностей по эндпоинту, иначе из дефолта по format_to.
+    """
+
+    def __init__(self) -> None:
+        self._runtime_ema: Dict[str, float] = {}
+        self._lock = threading.Lock()
+
+    def observe_completion(self, endpoint: Optional[str], runtime_seconds: float) -> None:
+        if not endpoint or runtime_seconds <= 0:
+            return
+        with self._lock:
+            prev = self._runtime_ema.get(endpoint)
+            self._runtime_ema[endpoint] = runtime_seconds if prev is None else 0.8 * prev + 0.2 * runtime_seconds
+
+    def typical_runtime(self, model_info: Optional[Dict[str, Any]]) -> float:
+        info = model_info or {}
+        configured = info.get("typical_runtime")
+        if configured:
+            return float(configured)
+        endpoint = info.get("endpoint")
+        if endpoint:
+            with self._lock:
+                observed = self._runtime_ema.get(endpoint)
+            if observed:
+                return observed
+        if info.get("format_to") == "image":
+            return float(settings.fal_typical_runtime_image_seconds)
+        return float(settings.fal_typical_runtime_video_seconds)
+
+    def next_delay(
+        self,
+        age_seconds: float,
+        model_info: Optional[Dict[str, Any]],
+        fal_status: Optional[str],
+        queue_position: Optional[int],
+        max_overdue_delay: float,
+        webhook: bool = False,
+    ) -> float:
+        min_delay = float(settings.fal_poll_min_delay_seconds)
+        if webhook:
+            # Завершение придёт вебхуком; поллер лишь страхует, если вебхук запаздывает
+            remaining = self.typical_runtime(model_info) + settings.fal_poll_webhook_grace_seconds - age_seconds
+            delay = remaining if remaining > 0 else settings.fal_poll_webhook_fallback_interval_seconds
+        elif fal_status == "IN_QUEUE":
+            position = max(int(queue_position or 0), 0)
+            delay = settings.fal_poll_queue_delay_per_position_seconds * (position + 1)
+        else:
+            remaining = self.typical_runtime(model_info) - age_seconds
+            if remaining > 0:
+                # Проверим к ожидаемому моменту готовности
+                delay = remaining
+            else:
+                # Просрочена: чем дольше просрочка, тем реже, но не реже max_overdue_delay
+                delay = min(max(-remaining * 0.25, min_delay), max_overdue_delay)
+        return min(max(delay, min_delay), float(settings.fal_poll_max_delay_seconds))
+
+
 def _pick_media_url(request_status: dict, request_response: dict) -> Optional[str]:
     # При использовании fal-client достаточно разобрать response
     u = extract_media_url(request_response)
@@ -27,186 +139,475 @@ def _pick_media_url(request_status: dict, request_response: dict) -> Optional[st
     return None
 
 
-def run_poller(interval_seconds: int = 20) -> None:
-    """Бесконечный цикл поллинга очереди FAL для задач в статусах queued/processing."""
-    logger.info("fal.poll: started interval=%ss", interval_seconds)
-    while True:
+def _load_model_index(db: Session, model_ids: set) -> Dict[Any, Dict[str, Any]]:
+    """Загрузить все нужные тику модели одним IN-запросом.
+
+    Возвращает {model_id: {"endpoint": Model.name, "format_to": ..., "cost_unit": ..., "typical_runtime": ...}}.
+    """
+    if not model_ids:
+        return {}
+    rows = (
+        db.query(Model.id, Model.name, Model.format_to, Model.cost_unit, Model.options)
+        .filter(Model.id.in_(list(model_ids)))
+        .all()
+    )
+    index: Dict[Any, Dict[str, Any]] = {}
+    for mid, name, format_to, cost_unit, options in rows:
+        typical_runtime = options.get("typical_runtime_seconds") if isinstance(options, dict) else None
+        index[mid] = {
+            "endpoint": name if isinstance(name, str) and name else None,
+            "format_to": (format_to or "").strip().lower() or None,
+            "cost_unit": cost_unit,
+            "typical_runtime": typical_runtime if isinstance(typical_runtime, (int, float)) and typical_runtime > 0 else None,
+        }
+    return index
+
+
+async def _check_job(
+    client: AsyncFalClient,
+    limiter: EndpointRateLimiter,
+    semaphore: asyncio.Semaphore,
+    job_id: Any,
+    request_id: str,
+    model_id: Optional[str],
+) -> Dict[str, Any]:
+    """Сетевая часть проверки задачи (в событийном цикле поллера, без доступа к сессии БД)."""
+    endpoint = model_id or settings.fal_endpoint or ""
+    async with semaphore:
+        await limiter.acquire_async(endpoint)
+        st = await client.status(request_id, model_id=model_id)
+        st_status = (st.get("status") or "").upper()
+        logger.info(
+            "fal.poll: status job_id=%s request_id=%s status=%s",
+            job_id,
+            request_id,
+            st_status,
+        )
+        resp: Optional[Dict[str, Any]] = None
+        if st_status == "COMPLETED":
+            await limiter.acquire_async(endpoint)
+            try:
+                resp = await client.result(request_id, model_id=model_id)
+            except Exception:
+                logger.exception("fal.poll: get_request_response failed")
+                resp = {}
+    return {"status": st_status, "status_payload": st, "response": resp}
+
+
+async def _check_jobs(
+    client: AsyncFalClient,
+    limiter: EndpointRateLimiter,
+    checks: list[tuple[Any, str, Optional[str]]],
+) -> list[Any]:
+    """Параллельно проверить задачи тика (не более fal_poll_concurrency запросов одновременно).
+
+    Исключения возвращаются на месте результата соответствующей задачи.
+    """
+    semaphore = asyncio.Semaphore(max(1, int(settings.fal_poll_concurrency or 1)))
+    return await asyncio.gather(
+        *(_check_job(client, limiter, semaphore, job_id, request_id, model_id) for job_id, request_id, model_id in checks),
+        return_exceptions=True,
+    )
+
+
+def write_back(db: Session, rows: list[Dict[str, Any]]) -> int:
+    """Применить изменения задач тика одним UPDATE ... FROM (VALUES ...).
+
+    rows: {"id", "status" (None — не менять), "result_url" (None — не менять), "next_poll_at"}.
+    Статус меняется compare-and-set'ом по таблице ALLOWED_TRANSITIONS: поллер не перезапишет
+    результат, который успел сохранить вебхук. version и updated_at сдвигаются только при смене
+    статуса. Коммит — за вызывающим.
+    """
+    if not rows:
+        return 0
+    v = values(
+        column("id", PG_UUID(as_uuid=True)),
+        column("status", String),
+        column("result_url", Text),
+        column("next_poll_at", DateTime(timezone=True)),
+        name="v",
+    ).data([(r["id"], r.get("status"), r.get("result_url"), r.get("next_poll_at")) for r in rows])
+    status_changes = or_(
+        *(
+            and_(v.c.status == target, Job.status.in_(sorted(sources)))
+            for target, sources in SOURCES_BY_TARGET.items()
+            if sources
+        )
+    )
+    stmt = (
+        update(Job)
+        .where(Job.id == v.c.id)
+        .values(
+            status=case((status_changes, cast(v.c.status, Job.status.type)), else_=Job.status),
+            result_url=case((status_changes, func.coalesce(v.c.result_url, Job.result_url)), else_=Job.result_url),
+            next_poll_at=cast(v.c.next_poll_at, DateTime(timezone=True)),
+            version=case((status_changes, Job.version + 1), else_=Job.version),
+            updated_at=case((status_changes, func.now()), else_=Job.updated_at),
+        )
+        .execution_options(synchronize_session=False)
+    )
+    return db.execute(stmt).rowcount
+
+
+def effective_lease_seconds() -> float:
+    """Аренда тика не короче худшего случая завершения пачки (плюс запас на опрос FAL).
+
+    Пачка из fal_poll_finish_batch_size задач сохраняется волнами по fal_poll_store_concurrency
+    загрузок, каждая не дольше STORE_RESULT_TIMEOUT_SECONDS; аренда пачки продлевается перед её
+    обработкой, поэтому другой экземпляр поллера не заберёт задачи посреди загрузки.
+    """
+    chunk = max(1, int(settings.fal_poll_finish_batch_size))
+    concurrency = max(1, int(settings.fal_poll_store_concurrency))
+    worst_chunk = -(-chunk // concurrency) * STORE_RESULT_TIMEOUT_SECONDS
+    return max(float(settings.fal_poll_lease_seconds), worst_chunk + float(settings.fal_poll_interval_seconds))
+
+
+def _extend_lease(db: Session, job_ids: list[Any], until: datetime) -> None:
+    db.execute(
+        update(Job)
+        .where(Job.id.in_(job_ids))
+        .values(next_poll_at=until, updated_at=Job.updated_at)
+        .execution_options(synchronize_session=False)
+    )
+    db.commit()
+
+
+def _store_results(stores: list[tuple[Job, str, Optional[str]]]) -> list[Any]:
+    """Перекачать результаты пачки в S3 параллельно (не более fal_poll_store_concurrency загрузок).
+
+    Возвращает (public_url, key) или исключение на месте каждой задачи.
+    """
+    if not stores:
+        return []
+
+    def _store(item: tuple[Job, str, Optional[str]]) -> Any:
+        job, media_url, format_to = item
         try:
-            logger.info("fal.poll: tick start")
-            db: Session = SessionLocal()
+            return store_result(job, media_url, format_to, source="poller")
+        except Exception as exc:
+            logger.exception("fal.poll: failed to store result job_id=%s", job.id)
+            return exc
+
+    workers = min(len(stores), max(1, int(settings.fal_poll_store_concurrency)))
+    with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="fal-store") as executor:
+        return list(executor.map(_store, stores))
+
+
+def _finish_jobs(
+    db: Session,
+    finishing: list[tuple[Job, str, Optional[Dict[str, Any]], Dict[str, Any]]],
+    rows: Dict[Any, Dict[str, Any]],
+    announcements: list[Callable[[], None]],
+    retry_at: datetime,
+    lease_until: datetime,
+) -> None:
+    """Сохранить результаты завершённых задач пачкой и записать их статусы одним UPDATE.
+
+    Аренда пачки продлевается до lease_until, загрузки в S3 идут параллельно. Блокировки
+    completion_guard держатся до коммита пачки, поэтому результат сохраняет и объявляет ровно
+    один из конкурентов (поллер или вебхук). Уведомления — после коммита.
+    """
+    _extend_lease(db, [job.id for job, *_ in finishing], lease_until)
+    with ExitStack() as guards:
+        owned = []
+        for item in finishing:
+            if guards.enter_context(completion_guard(item[0].id, source="poller")):
+                owned.append(item)
+        if not owned:
+            return
+        # Одним запросом: какие задачи за время проверки уже завершил вебхук
+        finished = {
+            job_id
+            for job_id, in db.query(Job.id)
+            .filter(Job.id.in_([job.id for job, *_ in owned]))
+            .filter(Job.status.in_(FINAL_JOB_STATUSES))
+        }
+        batch = []
+        stores = []
+        for job, request_id, model_info, result in owned:
+            if job.id in finished:
+                logger.info("fal.poll: job already finished job_id=%s", job.id)
+                continue
+            st_status = result.get("status") or ""
+            if st_status != "COMPLETED":
+                logger.warning("fal.poll: job failed job_id=%s request_id=%s status=%s", job.id, request_id, st_status)
+                rows[job.id]["status"] = "failed"
+                batch.append(partial(announce_failure, job))
+                continue
+            media_url = _pick_media_url(result.get("status_payload") or {}, result.get("response") or {})
+            if not media_url:
+                # Нет URL — считаем ошибкой
+                logger.warning("fal.poll: media url not found job_id=%s request_id=%s", job.id, request_id)
+                rows[job.id]["status"] = "failed"
+                batch.append(partial(announce_failure, job, "media url not found"))
+                continue
+            stores.append((job, media_url, (model_info or {}).get("format_to")))
+        for (job, _, format_to), stored in zip(stores, _store_results(stores)):
+            if isinstance(stored, BaseException):
+                # не меняем статус на ошибку сразу, пробуем через интервал
+                rows[job.id]["next_poll_at"] = retry_at
+                continue
+            public_url, key = stored
+            rows[job.id].update({"status": "done", "result_url": public_url})
+            batch.append(partial(announce_completion, job, public_url, key, format_to))
+        write_back(db, [rows.pop(job.id) for job, *_ in owned])
+        db.commit()
+    logger.info("fal.poll: finished jobs count=%s", len(batch))
+    announcements.extend(batch)
+
+
+def _job_age_seconds(job: Job, now: datetime) -> float:
+    if not job.created_at:
+        return 0.0
+    created_at = job.created_at if job.created_at.tzinfo else job.created_at.replace(tzinfo=timezone.utc)
+    return max((now - created_at).total_seconds(), 0.0)
+
+
+def claim_due_jobs(db: Session, now: datetime, batch_size: int, lease_seconds: float) -> list[Job]:
+    """Забирает в работу пачку задач с наступившим сроком проверки.
+
+    Строки выбираются через FOR UPDATE SKIP LOCKED и сразу получают аренду: next_poll_at
+    сдвигается на lease_seconds вперёд, после чего транзакция коммитится и блокировки снимаются.
+    Другие экземпляры поллера эти задачи не увидят, пока аренда не истечёт (например, если
+    экземпляр упал посреди тика) или пока владелец не назначит следующую проверку.
+    """
+    # Условия совпадают с предикатом частичного индекса ix_jobs_active_next_poll
+    due = (
+        select(Job.id)
+        .where(Job.is_paid)
+        .where(Job.status.in_(["queued", "processing"]))
+        .where(or_(Job.next_poll_at.is_(None), Job.next_poll_at <= now))
+        .order_by(Job.next_poll_at.asc().nullsfirst())
+        .limit(batch_size)
+        .with_for_update(skip_locked=True)
+    )
+    claimed_ids = db.execute(
+        update(Job)
+        .where(Job.id.in_(due))
+        # updated_at не трогаем: аренда — не изменение задачи (на нём строится ETag списка задач)
+        .values(next_poll_at=now + timedelta(seconds=lease_seconds), updated_at=Job.updated_at)
+        .returning(Job.id)
+        .execution_options(synchronize_session=False)
+    ).scalars().all()
+    db.commit()
+    if not claimed_ids:
+        return []
+    return db.query(Job).filter(Job.id.in_(claimed_ids)).all()
+
+
+def poll_once(
+    db: Session,
+    loop: asyncio.AbstractEventLoop,
+    client: AsyncFalClient,
+    limiter: EndpointRateLimiter,
+    scheduler: PollScheduler,
+    interval_seconds: int,
+) -> int:
+    """Один тик поллера: забирает задачи с наступившим сроком проверки и параллельно опрашивает FAL.
+
+    Возвращает количество задач, по которым выполнялся запрос статуса.
+    """
+    # Уведомления после коммита берут поля из уже загруженных объектов, без повторного SELECT
+    db.expire_on_commit = False
+    now = datetime.now(timezone.utc)
+    lease_seconds = effective_lease_seconds()
+    jobs = claim_due_jobs(db, now, settings.fal_poll_batch_size, lease_seconds)
+    if not jobs:
+        return 0
+    logger.info("fal.poll: claimed jobs count=%s", len(jobs))
+
+    # Все модели тика — одним запросом вместо двух SELECT на каждую задачу
+    model_index: Dict[Any, Dict[str, Any]] = {}
+    try:
+        model_index = _load_model_index(db, {job.model_id for job in jobs if job.model_id})
+    except Exception:
+        logger.exception("fal.poll: failed to load models for tick")
+
+    # Изменения задач копим за тик и пишем пачками (write_back), без коммита на каждую задачу
+    rows: Dict[Any, Dict[str, Any]] = {}
+    # Сначала собираем всё, что нужно для сетевых вызовов, — ORM-объекты в корутины не передаём
+    pending = []
+    for job in jobs:
+        fal_meta = (job.meta or {}).get("fal") if isinstance(job.meta, dict) else None
+        request_id = getattr(job, "request_id", None) or (fal_meta.get("requestId") if isinstance(fal_meta, dict) else None)
+        if not request_id:
+            # Ещё не отправлена в FAL (отправку выполняет RQ-воркер, он же сбросит срок проверки);
+            # срок проверки сдвигаем явно, иначе задача висела бы на аренде до её истечения
+            rows[job.id] = {"id": job.id, "next_poll_at": now + timedelta(seconds=interval_seconds)}
+            continue
+        # endpoint/model_id для статуса всегда берём из Model.name
+        model_info = model_index.get(job.model_id) if job.model_id else None
+        model_id = (model_info or {}).get("endpoint")
+        logger.info(
+            "fal.poll: job begin job_id=%s status=%s request_id=%s model_id=%s",
+            job.id,
+            job.status,
+            request_id,
+            model_id,
+        )
+        pending.append((job, str(request_id), model_info, model_id, bool((fal_meta or {}).get("webhook"))))
+
+    results = loop.run_until_complete(
+        _check_jobs(client, limiter, [(job.id, request_id, model_id) for job, request_id, _, model_id, _ in pending])
+    )
+    retry_at = now + timedelta(seconds=interval_seconds)
+    finishing = []
+    for (job, request_id, model_info, _, webhook), result in zip(pending, results):
+        if isinstance(result, BaseException):
+            logger.error("fal.poll: error checking job_id=%s error=%r", job.id, result)
+            # не меняем статус на ошибку сразу, пробуем через интервал
+            rows[job.id] = {"id": job.id, "next_poll_at": retry_at}
+            continue
+        age = _job_age_seconds(job, now)
+        st_status = result.get("status") or ""
+        if st_status == "COMPLETED":
+            scheduler.observe_completion((model_info or {}).get("endpoint"), age)
+        delay = scheduler.next_delay(
+            age,
+            model_info,
+            st_status,
+            (result.get("status_payload") or {}).get("queue_position"),
+            float(interval_seconds),
+            webhook=webhook,
+        )
+        rows[job.id] = {"id": job.id, "next_poll_at": now + timedelta(seconds=delay)}
+        logger.info("fal.poll: next check job_id=%s status=%s in=%ss", job.id, st_status, int(delay))
+        if st_status == "IN_PROGRESS" and job.status != "processing":
+            rows[job.id]["status"] = "processing"
+        elif st_status in ("COMPLETED", "FAILED", "CANCELLED", "ERROR"):
+            finishing.append((job, request_id, model_info, result))
+
+    # Сроки следующих проверок и processing-переходы — до загрузок результатов,
+    # чтобы медленная пачка не задерживала планирование остальных задач тика
+    finishing_ids = {job.id for job, *_ in finishing}
+    write_back(db, [row for job_id, row in rows.items() if job_id not in finishing_ids])
+    db.commit()
+    rows = {job_id: row for job_id, row in rows.items() if job_id in finishing_ids}
+
+    announcements: list[Callable[[], None]] = []
+    chunk = max(1, int(settings.fal_poll_finish_batch_size))
+    for i in range(0, len(finishing), chunk):
+        try:
+            lease_until = datetime.now(timezone.utc) + timedelta(seconds=lease_seconds)
+            _finish_jobs(db, finishing[i:i + chunk], rows, announcements, retry_at, lease_until)
+        except Exception:
+            logger.exception("fal.poll: failed to finish jobs batch")
+            db.rollback()
+            for job, *_ in finishing[i:i + chunk]:
+                rows.setdefault(job.id, {"id": job.id})["next_poll_at"] = retry_at
+
+    # Завершаемые задачи, которые не удалось закрыть (занята блокировка, ошибка пачки), — на повтор
+    write_back(db, list(rows.values()))
+    db.commit()
+
+    for announce in announcements:
+        try:
+            announce()
+        except Exception:
+            logger.exception("fal.poll: notification failed")
+    return len(pending)
+
+
+def run_poller(
+    interval_seconds: int = 20,
+    stop_event: Optional[threading.Event] = None,
+    session_factory: sessionmaker = SessionLocal,
+) -> None:
+    """Цикл поллинга очереди FAL для задач в статусах queued/processing.
+
+    Тики идут каждые fal_poll_tick_seconds и затрагивают только задачи с наступившим next_poll_at;
+    interval_seconds — верхняя граница паузы между проверками просроченной задачи.
+    После установки stop_event новые задачи не забираются: текущий тик доводится до конца
+    (включая загрузку результатов в S3), затем цикл завершается.
+    """
+    stop = stop_event or threading.Event()
+    concurrency = max(1, int(settings.fal_poll_concurrency or 1))
+    # Собственный событийный цикл потока поллера: запросы к FAL идут через общий пул httpx
+    loop = asyncio.new_event_loop()
+    client = AsyncFalClient()
+    limiter = EndpointRateLimiter(settings.fal_poll_endpoint_rps, settings.fal_poll_endpoint_rps_overrides)
+    scheduler = PollScheduler()
+    tick_seconds = max(0.5, float(settings.fal_poll_tick_seconds))
+    logger.info(
+        "fal.poll: started interval=%ss tick=%ss concurrency=%s",
+        interval_seconds,
+        tick_seconds,
+        concurrency,
+    )
+    try:
+        while not stop.is_set():
+            tick_start = time.perf_counter()
+            checked = 0
             try:
-                # Выбираем оплаченные задачи, ожидающие исполнения
-                jobs = (
-                    db.query(Job)
-                    .filter(Job.is_paid.is_(True))
-                    .filter(Job.status.in_(["queued", "processing"]))
-                    .all()
-                )
-                logger.info("fal.poll: active jobs count=%s", len(jobs))
-                for job in jobs:
-                    fal_meta = (job.meta or {}).get("fal") if isinstance(job.meta, dict) else None
-                    request_id = (getattr(job, "request_id", None) or (fal_meta.get("requestId") if isinstance(fal_meta, dict) else None))
-                    # endpoint/model_id для статуса всегда берём из Model.name
-                    model_id = None
-                    if job.model_id:
-                        try:
-                            m = db.query(Model).filter(Model.id == job.model_id).first()
-                            if m and isinstance(m.name, str) and m.name:
-                                parts = m.name.split("/")
-                                model_id = m.name
-                        except Exception:
-                            logger.exception("fal.poll: failed to derive model_id from model.name for job_id=%s", job.id)
-                    if not request_id:
-                        continue
-
-                    try:
-                        logger.info(
-                            "fal.poll: job begin job_id=%s status=%s request_id=%s model_id=%s",
-                            job.id,
-                            job.status,
-                            request_id,
-                            model_id,
-                        )
-                        st = get_request_status(request_id, logs=False, model_id=model_id)
-                        st_status = (st.get("status") or "").upper()
-                        logger.info(
-                            "fal.poll: status job_id=%s request_id=%s status=%s",
-                            job.id,
-                            request_id,
-                            st_status,
-                        )
-                        if st_status == "IN_PROGRESS":
-                            if job.status != "processing":
-                                job.status = "processing"
-                                db.commit()
-                                db.refresh(job)
-                                logger.info("fal.poll: job moved to processing job_id=%s", job.id)
-                            continue
-                        if st_status == "COMPLETED":
-                            try:
-                                resp = get_request_response(request_id, model_id=model_id)
-                            except Exception:
-                                logger.exception("fal.poll: get_request_response failed")
-                                resp = {}
-                            media_url = _pick_media_url(st, resp or {})
-                            if not media_url:
-                                # Нет URL — считаем ошибкой
-                                job.status = "failed"
-                                db.commit()
-                                db.refresh(job)
-                                logger.warning("fal.poll: media url not found job_id=%s request_id=%s", job.id, request_id)
-                                notify_job_event(
-                                    event="job.failed",
-                                    job_id=str(job.id),
-                                    user_id=str(job.user_id) if job.user_id else None,
-                                    status="failed",
-                                    service_type=None,
-                                    message="media url not found",
-                                )
-                                continue
-
-                            # Скачиваем и кладем в S3
-                            media_bytes = fetch_bytes(media_url, timeout=180)
-                            logger.info(
-                                "fal.poll: fetched media bytes job_id=%s bytes=%s url=%s",
-                                job.id,
-                                len(media_bytes) if isinstance(media_bytes, (bytes, bytearray)) else None,
-                                media_url,
-                            )
-
-                            # Определяем тип результата по модели (format_to)
-                            fmt_to = None
-                            try:
-                                if job.model_id:
-                                    m = db.query(Model).filter(Model.id == job.model_id).first()
-                                    fmt_to = (m.format_to or "").strip().lower() if m and m.format_to else None
-                            except Exception:
-                                logger.exception("fal.poll: failed to load model for job_id=%s", job.id)
-                            if fmt_to == "image":
-                                lower_url = (media_url or "").lower()
-                                if lower_url.endswith((".jpg", ".jpeg")):
-                                    ext = ".jpg"
-                                    content_type = "image/jpeg"
-                                elif lower_url.endswith(".png"):
-                                    ext = ".png"
-                                    content_type = "image/png"
-                                else:
-                                    ext = ".png"
-                                    content_type = "image/png"
-                                key = s3_key_for_video(job.anon_user_id or "user", job.order_id or str(job.id), 0, ext)
-                                upload_bytes(settings.s3_bucket_name or "", key, media_bytes, content_type=content_type)
-                            else:
-                                key = s3_key_for_video(job.anon_user_id or "user", job.order_id or str(job.id), 0, ".mp4")
-                                upload_bytes(settings.s3_bucket_name or "", key, media_bytes, content_type="video/mp4")
-                            logger.info(
-                                "fal.poll: uploaded to s3 bucket=%s key=%s",
-                                settings.s3_bucket_name,
-                                key,
-                            )
-                            public_url, _ = get_file_url_with_expiry(settings.s3_bucket_name or "", key)
-                            job.result_url = public_url
-                            job.status = "done"
-                            db.commit()
-                            db.refresh(job)
-                            logger.info(
-                                "fal.poll: job completed job_id=%s result_url=%s",
-                                job.id,
-                                public_url,
-                            )
-
-                            # Канал уведомления:
-                            # - для задач с generation_source="site" и наличием email — отправляем письмо с ссылкой
-                            # - иначе — уведомляем Telegram-бот
-                            try:
-                                gen_src = (getattr(job, "generation_source", None) or "").strip().lower()
-                            except Exception:
-                                gen_src = None
-                            if gen_src == "site" and job.email:
-                                try:
-                                    send_email_with_links(recipient_email=job.email, links=[public_url], job_id=str(job.id))
-                                    logger.info("fal.poll: email with result sent to %s for job_id=%s", job.email, job.id)
-                                except Exception:
-                                    logger.exception("fal.poll: failed to send result email job_id=%s", job.id)
-                            else:
-                                notify_job_event(
-                                    event="job.completed",
-                                    job_id=str(job.id),
-                                    user_id=str(job.user_id) if job.user_id else None,
-                                    status="done",
-                                    service_type=None,
-                                    result_url=public_url,
-                                )
-                            continue
-                        if st_status in ("FAILED", "CANCELLED", "ERROR"):
-                            job.status = "failed"
-                            db.commit()
-                            db.refresh(job)
-                            logger.warning(
-                                "fal.poll: job failed job_id=%s request_id=%s status=%s",
-                                job.id,
-                                request_id,
-                                st_status,
-                            )
-                            notify_job_event(
-                                event="job.failed",
-                                job_id=str(job.id),
-                                user_id=str(job.user_id) if job.user_id else None,
-                                status="failed",
-                                service_type=None,
-                            )
-                            continue
-                    except Exception:
-                        logger.exception("fal.poll: error processing job_id=%s", job.id)
-                        # не меняем статус на ошибку сразу, пробуем в следующий цикл
-                        continue
+                db: Session = session_factory()
+                try:
+                    checked = poll_once(db, loop, client, limiter, scheduler, interval_seconds)
+                finally:
+                    db.close()
+            except Exception:
+                logger.exception("fal.poll: unexpected loop error")
+                # защита от tight loop — продолжим через интервал
             finally:
-                db.close()
-        except Exception:
-            logger.exception("fal.poll: unexpected loop error")
-            # защита от tight loop — продолжим через интервал
-            continue
-        finally:
-            logger.info("fal.poll: tick end")
-            time.sleep(interval_seconds)
+                elapsed = time.perf_counter() - tick_start
+                if checked:
+                    POLL_TICK_SECONDS.observe(elapsed)
+                    POLL_JOBS_CHECKED.inc(checked)
+                    logger.info("fal.poll: tick end checked=%s elapsed_ms=%s", checked, int(elapsed * 1000))
+                if elapsed > interval_seconds:
+                    logger.warning(
+                        "fal.poll: tick took longer than interval elapsed_ms=%s interval=%ss",
+                        int(elapsed * 1000),
+                        interval_seconds,
+                    )
+            stop.wait(max(0.0, tick_seconds - elapsed))
+    finally:
+        loop.run_until_complete(client.aclose())
+        loop.close()
+    logger.info("fal.poll: stopped")
+
+
+def main() -> None:
+    """Отдельный процесс поллера: свой пул соединений БД и плавная остановка по SIGTERM/SIGINT.
+
+    Запуск: python -m app.services.fal_poller (в API при этом FAL_POLLER_IN_PROCESS=false).
+    Аренда задач (SKIP LOCKED) позволяет запускать несколько экземпляров.
+    """
+    logging.basicConfig(
+        stream=sys.stdout,
+        level=logging.INFO,
+        format="%(asctime)s %(levelname)s [%(name)s] %(message)s",
+    )
+    logging.getLogger("sqlalchemy.engine").setLevel(logging.WARNING)
+
+    stop = threading.Event()
+
+    def _request_stop(signum, _frame) -> None:
+        if stop.is_set():
+            logger.warning("fal.poll: second signal=%s, exiting without drain", signum)
+            sys.exit(1)
+        logger.info("fal.poll: signal=%s, draining current tick", signum)
+        stop.set()
+
+    signal.signal(signal.SIGTERM, _request_stop)
+    signal.signal(signal.SIGINT, _request_stop)
+
+    session_factory = create_session_factory(
+        pool_size=settings.fal_poller_db_pool_size,
+        max_overflow=settings.fal_poller_db_max_overflow,
+        pool_timeout=settings.fal_poller_db_pool_timeout_seconds,
+        label="poller",
+    )
+    try:
+        from app.services.s3 import warmup_s3_clients
+        warmup_s3_clients()
+    except Exception:
+        logger.exception("fal.poll: s3 client warmup failed")
+    if settings.fal_poller_metrics_port:
+        from prometheus_client import start_http_server
+        start_http_server(settings.fal_poller_metrics_port)
+        logger.info("fal.poll: metrics on :%s/metrics", settings.fal_poller_metrics_port)
+    run_poller(int(settings.fal_poll_interval_seconds), stop_event=stop, session_factory=session_factory)
 
 
+if __name__ == "__main__":
+    main()
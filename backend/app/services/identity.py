@@ -0,0 +1,102 @@
+from __future__ import annotations
+
+import logging
+import uuid
+from typing import Any, Optional
+
+from sqlalchemy import func, or_, select
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session
+
+from app.db.models import User
+
+
+logger = logging.getLogger(__name__)
+
+# Идентификаторы пользователя в порядке приоритета; у каждого — уникальный индекс в users
+IDENTITY_KEYS = ("telegram_id", "anon_user_id", "email")
+
+
+def _upsert(db: Session, key: str, identity: dict[str, Any], ref_code: Optional[str]) -> tuple[User, bool]:
+    """INSERT ... ON CONFLICT (key) DO UPDATE ... RETURNING users.* — один запрос к БД.
+
+    Новому пользователю сразу выдаются свой ref_code и referrer_id (подзапрос по refCode).
+    У существующего: username обновляется, если передан, пустые anon_user_id/ref_code
+    заполняются (только при поиске по telegram_id — как в register-or-login), остальное не трогается.
+    """
+    new_id = uuid.uuid4()
+    values: dict[str, Any] = {k: v for k, v in identity.items() if v is not None}
+    values["id"] = new_id
+    values["ref_code"] = uuid.uuid4().hex[:8]
+    if ref_code:
+        values["referrer_id"] = select(User.id).where(User.ref_code == ref_code).scalar_subquery()
+
+    stmt = pg_insert(User).values(**values)
+    table = User.__table__
+    set_: dict[str, Any] = {key: stmt.excluded[key]}
+    if key == "telegram_id":
+        set_["username"] = func.coalesce(stmt.excluded.username, table.c.username)
+        set_["anon_user_id"] = func.coalesce(table.c.anon_user_id, stmt.excluded.anon_user_id)
+        set_["ref_code"] = func.coalesce(table.c.ref_code, stmt.excluded.ref_code)
+    stmt = stmt.on_conflict_do_update(index_elements=[table.c[key]], set_=set_).returning(User)
+    user = db.scalars(stmt, execution_options={"populate_existing": True}).one()
+    return user, user.id == new_id
+
+
+def _resolve_conflict(db: Session, key: str, identity: dict[str, Any]) -> Optional[User]:
+    """Upsert упёрся в уникальность другого идентификатора (он принадлежит другому пользователю).
+
+    Если пользователь с ключом поиска уже есть — возвращаем его без изменений. Иначе берём
+    владельца другого идентификатора и дописываем ему ключ, если тот пуст
+    (например, anon_user_id к пользователю с тем же email).
+    """
+    user = db.query(User).filter(getattr(User, key) == identity[key]).first()
+    if user is not None:
+        return user
+    others = [getattr(User, k) == identity[k] for k in IDENTITY_KEYS if k != key and identity.get(k)]
+    if not others:
+        return None
+    user = db.query(User).filter(or_(*others)).first()
+    if user is not None and getattr(user, key) is None:
+        try:
+            with db.begin_nested():
+                setattr(user, key, identity[key])
+        except IntegrityError:
+            logger.info("identity: %s already taken, keeping user_id=%s as is", key, user.id)
+    return user
+
+
+def resolve_user(
+    db: Session,
+    *,
+    telegram_id: Optional[str] = None,
+    anon_user_id: Optional[str] = None,
+    email: Optional[str] = None,
+    username: Optional[str] = None,
+    ref_code: Optional[str] = None,
+    key: Optional[str] = None,
+) -> tuple[User, bool]:
+    """Найти или создать пользователя по telegram_id, anon_user_id или email.
+
+    key — идентификатор, по которому ищем (по умолчанию первый переданный из IDENTITY_KEYS);
+    остальные записываются только новому пользователю. Возвращает (пользователь, создан ли он).
+    Повторный пользователь стоит тот же один запрос, что и новый: upsert сразу возвращает строку.
+    Коммит — за вызывающим.
+    """
+    identity = {"telegram_id": telegram_id, "anon_user_id": anon_user_id, "email": email}
+    key = key or next((k for k in IDENTITY_KEYS if identity[k]), None)
+    if key is None or not identity.get(key):
+        raise ValueError("telegram_id, anon_user_id or email is required")
+
+    try:
+        with db.begin_nested():
+            user, created = _upsert(db, key, {**identity, "username": username}, ref_code)
+    except IntegrityError:
+        user = _resolve_conflict(db, key, identity)
+        if user is None:
+            raise
+        created = False
+    if created:
+        logger.info("identity: created user_id=%s by %s", user.id, key)
+    return user, created
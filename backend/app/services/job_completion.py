@@ -0,0 +1,180 @@
+from __future__ import annotations
+
+import logging
+from contextlib import contextmanager
+from typing import Any, Iterator, Optional
+
+from redis import Redis
+from redis.exceptions import LockError, RedisError
+from sqlalchemy.orm import Session
+
+from app.core.config import settings
+from app.db.models import Job
+from app.services.email_service import send_email_with_links
+from app.services.fal import stream_to_s3
+from app.services.job_state import transition_job
+from app.services.metrics import NOTIFICATION_SECONDS, model_label, observe_job_done
+from app.services.s3_utils import s3_key_for_video, get_file_url_with_expiry
+from app.services.telegram_service import notify_job_event
+from app.workers.worker import enqueue_postprocess
+
+
+logger = logging.getLogger(__name__)
+
+# Статусы, после которых результат задачи уже сохранён/объявлен и повторно не обрабатывается
+FINAL_JOB_STATUSES = ("done", "failed")
+
+# Таймаут перекачки одного результата FAL → S3 (из него считается аренда тика поллера)
+STORE_RESULT_TIMEOUT_SECONDS = 180
+
+_redis: Optional[Redis] = None
+
+
+def _redis_client() -> Redis:
+    global _redis
+    if _redis is None:
+        _redis = Redis.from_url(settings.redis_url, socket_connect_timeout=2, socket_timeout=2)
+    return _redis
+
+
+@contextmanager
+def completion_guard(job_id: Any, source: str) -> Iterator[bool]:
+    """Single-flight завершения задачи: вебхук, поллер и повторные доставки не обрабатывают её параллельно.
+
+    Пока идёт загрузка результата, в Redis лежит ключ job:complete:<id> (маркер «ingesting»).
+    Возвращает False, если задачу уже завершает другой процесс. Захвативший обязан перечитать
+    задачу из БД и пропустить её, если статус уже финальный, — так результат скачивается,
+    сохраняется и объявляется ровно один раз. Без Redis защита не действует (прежнее поведение).
+    """
+    lock = None
+    try:
+        lock = _redis_client().lock(
+            f"job:complete:{job_id}",
+            timeout=settings.job_completion_lock_seconds,
+            blocking=False,
+        )
+        acquired = lock.acquire()
+    except RedisError:
+        logger.warning("job.complete: redis unavailable, proceeding without guard job_id=%s source=%s", job_id, source)
+        lock = None
+        acquired = True
+    if not acquired:
+        logger.info("job.complete: already in progress elsewhere job_id=%s source=%s", job_id, source)
+        yield False
+        return
+    try:
+        yield True
+    finally:
+        if lock is not None:
+            try:
+                lock.release()
+            except (LockError, RedisError):
+                logger.warning("job.complete: lock expired before release job_id=%s source=%s", job_id, source)
+
+
+def result_file_type(format_to: Optional[str], media_url: str) -> tuple[str, str]:
+    """Расширение и Content-Type сохраняемого результата по формату модели (format_to)."""
+    if format_to == "image":
+        lower_url = (media_url or "").lower()
+        if lower_url.endswith((".jpg", ".jpeg")):
+            return ".jpg", "image/jpeg"
+        return ".png", "image/png"
+    return ".mp4", "video/mp4"
+
+
+def store_result(job: Job, media_url: str, format_to: Optional[str], source: str) -> tuple[str, str]:
+    """Перекачать результат FAL в S3 потоком, не держа файл целиком в памяти.
+
+    Возвращает (presigned-ссылка, ключ S3). БД не трогает; ошибки загрузки пробрасываются.
+    """
+    ext, content_type = result_file_type(format_to, media_url)
+    key = s3_key_for_video(job.anon_user_id or "user", job.order_id or str(job.id), 0, ext)
+    transferred = stream_to_s3(media_url, settings.s3_bucket_name or "", key, content_type=content_type, timeout=STORE_RESULT_TIMEOUT_SECONDS)
+    logger.info(
+        "job.complete: uploaded to s3 job_id=%s source=%s bucket=%s key=%s bytes=%s url=%s",
+        job.id,
+        source,
+        settings.s3_bucket_name,
+        key,
+        transferred,
+        media_url,
+    )
+    public_url, _ = get_file_url_with_expiry(settings.s3_bucket_name or "", key)
+    return public_url, key
+
+
+def notify_completion(job: Job, public_url: str) -> None:
+    """Уведомить пользователя о готовом результате по ссылке public_url."""
+    # Канал уведомления:
+    # - для задач с generation_source="site" и наличием email — отправляем письмо с ссылкой
+    # - иначе — уведомляем Telegram-бот
+    gen_src = (getattr(job, "generation_source", None) or "").strip().lower()
+    if gen_src == "site" and job.email:
+        try:
+            with NOTIFICATION_SECONDS.labels(channel="email", event="job.completed").time():
+                send_email_with_links(recipient_email=job.email, links=[public_url], job_id=str(job.id))
+            logger.info("job.complete: email with result sent to %s for job_id=%s", job.email, job.id)
+        except Exception:
+            logger.exception("job.complete: failed to send result email job_id=%s", job.id)
+    else:
+        with NOTIFICATION_SECONDS.labels(channel="telegram", event="job.completed").time():
+            notify_job_event(
+                event="job.completed",
+                job_id=str(job.id),
+                user_id=str(job.user_id) if job.user_id else None,
+                status="done",
+                service_type=job.service_type,
+                result_url=public_url,
+            )
+
+
+def announce_completion(job: Job, public_url: str, key: str, format_to: Optional[str]) -> None:
+    """Постобработка и уведомление о готовом результате (после коммита статуса done).
+
+    Видео, ушедшее на постобработку, объявляет уже process_run_job — со ссылкой на обработанный
+    файл, который к тому моменту записан в result_url.
+    """
+    observe_job_done(model_label(job.model_id), job.created_at)
+    if format_to != "image" and enqueue_postprocess(str(job.id), settings.s3_bucket_name or "", key):
+        return
+    notify_completion(job, public_url)
+
+
+def announce_failure(job: Job, message: Optional[str] = None) -> None:
+    """Уведомление о неудачной задаче (после коммита статуса failed)."""
+    with NOTIFICATION_SECONDS.labels(channel="telegram", event="job.failed").time():
+        notify_job_event(
+            event="job.failed",
+            job_id=str(job.id),
+            user_id=str(job.user_id) if job.user_id else None,
+            status="failed",
+            service_type=job.service_type,
+            message=message,
+        )
+
+
+def complete_job(db: Session, job: Job, media_url: str, format_to: Optional[str], source: str) -> Optional[str]:
+    """Сохранить результат, перевести задачу в done и уведомить пользователя (под completion_guard).
+
+    Возвращает presigned-ссылку на результат или None, если задачу уже завершили;
+    ошибки загрузки пробрасываются вызывающему (он решает, повторять ли попытку).
+    """
+    public_url, key = store_result(job, media_url, format_to, source)
+    if transition_job(db, job.id, "done", values={"result_url": public_url}) is None:
+        db.commit()
+        return None
+    db.commit()
+    logger.info("job.complete: job completed job_id=%s source=%s result_url=%s", job.id, source, public_url)
+    announce_completion(job, public_url, key, format_to)
+    return public_url
+
+
+def fail_job(db: Session, job: Job, source: str, message: Optional[str] = None) -> bool:
+    """Перевести задачу в failed и уведомить пользователя (под completion_guard)."""
+    if transition_job(db, job.id, "failed") is None:
+        db.commit()
+        return False
+    db.commit()
+    logger.warning("job.complete: job failed job_id=%s source=%s message=%s", job.id, source, message)
+    announce_failure(job, message)
+    return True
@@ -0,0 +1,73 @@
+from __future__ import annotations
+
+import logging
+from typing import Any, Dict, Iterable, Optional
+
+from sqlalchemy import func, update
+from sqlalchemy.orm import Session
+
+from app.db.models import Job
+
+
+logger = logging.getLogger(__name__)
+
+# Допустимые переходы статуса задачи. done/failed — финальные
+ALLOWED_TRANSITIONS: Dict[str, frozenset[str]] = {
+    "waiting_payment": frozenset({"queued", "failed"}),
+    "queued": frozenset({"processing", "done", "failed"}),
+    "processing": frozenset({"done", "failed"}),
+    "done": frozenset(),
+    "failed": frozenset(),
+}
+
+# Обратный индекс: из каких статусов можно попасть в данный
+SOURCES_BY_TARGET: Dict[str, frozenset[str]] = {
+    target: frozenset(src for src, targets in ALLOWED_TRANSITIONS.items() if target in targets)
+    for target in ALLOWED_TRANSITIONS
+}
+
+
+def transition_job(
+    db: Session,
+    job_id: Any,
+    to_status: str,
+    *,
+    expected: str | Iterable[str] | None = None,
+    expected_version: Optional[int] = None,
+    values: Optional[Dict[str, Any]] = None,
+) -> Optional[int]:
+    """Сменить статус задачи compare-and-set'ом, без блокировок и чтения перед записью.
+
+    UPDATE jobs SET status=:to, version=version+1 ... WHERE id=:id AND status IN (:expected)
+    [AND version=:expected_version]. expected по умолчанию — все статусы, из которых переход
+    в to_status разрешён (ALLOWED_TRANSITIONS), поэтому поздний «processing» не перезапишет «done».
+    values — дополнительные колонки, которые пишутся только вместе с успешным переходом.
+
+    Возвращает новую версию строки или None, если задачу уже перевёл кто-то другой.
+    Загруженный в сессию объект Job синхронизируется; коммит — за вызывающим.
+    """
+    allowed_sources = SOURCES_BY_TARGET.get(to_status)
+    if allowed_sources is None:
+        raise ValueError(f"unknown job status: {to_status}")
+    if expected is None:
+        sources = allowed_sources
+    else:
+        sources = frozenset([expected] if isinstance(expected, str) else expected)
+        illegal = sources - allowed_sources
+        if illegal:
+            raise ValueError(f"illegal job transition {sorted(illegal)} -> {to_status}")
+
+    stmt = (
+        update(Job)
+        .where(Job.id == job_id)
+        .where(Job.status.in_(sorted(sources)))
+        .values(status=to_status, version=Job.version + 1, updated_at=func.now(), **(values or {}))
+        .returning(Job.version)
+        .execution_options(synchronize_session="fetch")
+    )
+    if expected_version is not None:
+        stmt = stmt.where(Job.version == expected_version)
+    new_version = db.execute(stmt).scalar_one_or_none()
+    if new_version is None:
+        logger.info("job.state: transition rejected job_id=%s to=%s expected=%s", job_id, to_status, sorted(sources))
+    return new_version
@@ -0,0 +1,281 @@
+from __future__ import annotations
+
+import logging
+from datetime import datetime, timedelta, timezone
+from decimal import Decimal
+from typing import Any, Dict, Optional
+
+from rq import Retry, get_current_job
+
+from app.core.config import settings
+from app.database import SessionLocal
+from app.db.models import Job, Model
+from app.services.balance import credit_tokens
+from app.services.fal import submit_generation
+from app.services.job_state import transition_job
+from app.services.queue import get_queue
+from app.services.telegram_service import notify_job_event
+
+
+logger = logging.getLogger(__name__)
+
+# Поддерживаемые сценарии (format_from, format_to) -> prompt по умолчанию
+DEFAULT_PROMPTS: Dict[tuple[str, str], str] = {
+    ("image", "video"): "Animate this image",
+    ("text", "image"): "Generate image",
+    ("image", "image"): "",
+    ("text", "video"): "Generate video",
+}
+
+
+def extract_prompt_from_input(input_objects: list | None) -> str | None:
+    if not isinstance(input_objects, list):
+        return None
+    for it in input_objects:
+        if not isinstance(it, dict):
+            continue
+        # Поддержка упрощённого формата: prompt прямо в объекте
+        if isinstance(it.get("prompt"), str) and it.get("prompt").strip():
+            return it.get("prompt").strip()
+        name = it.get("name")
+        typ = it.get("type")
+        if name == "prompt" and (typ in ("text", None)):
+            val = it.get("value")
+            if isinstance(val, str) and val.strip():
+                return val.strip()
+    # Фоллбек: любой text-элемент с value
+    for it in input_objects:
+        if not isinstance(it, dict):
+            continue
+        if (it.get("type") == "text") and isinstance(it.get("value"), str) and it.get("value").strip():
+            return it.get("value").strip()
+    return None
+
+
+def extract_image_url(input_objects: list | None) -> str | None:
+    """Поддерживаем варианты { url }, { image_url }, { value: "..." } и { value: ["...", ...] }."""
+    if not isinstance(input_objects, list):
+        return None
+    for it in input_objects:
+        if not isinstance(it, dict):
+            continue
+        for key in ("url", "image_url"):
+            val = it.get(key)
+            if isinstance(val, str) and val:
+                return val
+        val = it.get("value")
+        if isinstance(val, str) and val:
+            return val
+        if isinstance(val, list):
+            for cand in val:
+                if isinstance(cand, str) and cand:
+                    return cand
+    return None
+
+
+def extract_extra_args(input_objects: list | None) -> dict:
+    args: dict = {}
+    if not isinstance(input_objects, list):
+        return args
+    for it in input_objects:
+        if not isinstance(it, dict):
+            continue
+        name = it.get("name")
+        typ = it.get("type")
+        if not isinstance(name, str) or name in ("prompt", "image_url"):
+            continue
+        if typ == "upload_zone":
+            # загрузки файлов собираем отдельно как image_url
+            continue
+        if "value" in it:
+            val = it.get("value")
+            if isinstance(val, (str, int, float, bool)) and val != "":
+                args[name] = val
+    return args
+
+
+def resolve_fal_endpoint(model: Model) -> Optional[str]:
+    """Эндпоинт из модели: options.fal_endpoint | options.endpoint | model.name."""
+    options = model.options or {}
+    endpoint = None
+    if isinstance(options, dict):
+        endpoint = options.get("fal_endpoint") or options.get("endpoint")
+    return endpoint or model.name
+
+
+def format_pair(model: Model) -> tuple[str, str]:
+    return (model.format_from or "").strip().lower(), (model.format_to or "").strip().lower()
+
+
+def is_submittable(model: Model) -> bool:
+    return format_pair(model) in DEFAULT_PROMPTS
+
+
+def typical_runtime_seconds(model: Model) -> float:
+    """Типичное время генерации: options.typical_runtime_seconds или дефолт по формату результата."""
+    options = model.options or {}
+    configured = options.get("typical_runtime_seconds") if isinstance(options, dict) else None
+    if isinstance(configured, (int, float)) and configured > 0:
+        return float(configured)
+    if format_pair(model)[1] == "image":
+        return float(settings.fal_typical_runtime_image_seconds)
+    return float(settings.fal_typical_runtime_video_seconds)
+
+
+def enqueue_job_submission(job_id: str) -> None:
+    """Поставить отправку задачи в FAL в очередь RQ.
+
+    Если Redis недоступен — отправляем синхронно, чтобы оплаченная задача не потерялась.
+    """
+    try:
+        queue = get_queue(settings.fal_submit_queue_name)
+        queue.enqueue(
+            submit_job_task,
+            str(job_id),
+            job_id=f"fal-submit-{job_id}",
+            retry=Retry(max=settings.fal_submit_max_retries, interval=list(settings.fal_submit_retry_intervals)),
+            job_timeout=settings.fal_submit_job_timeout_seconds,
+            result_ttl=3600,
+            failure_ttl=7 * 24 * 3600,
+        )
+        logger.info("fal.submit: enqueued job_id=%s queue=%s", job_id, settings.fal_submit_queue_name)
+    except Exception:
+        logger.exception("fal.submit: enqueue failed, submitting inline job_id=%s", job_id)
+        try:
+            submit_job_task(str(job_id))
+        except Exception:
+            # Задача уже помечена failed и резерв возвращён в submit_job_task
+            logger.exception("fal.submit: inline submission failed job_id=%s", job_id)
+
+
+def _is_final_attempt() -> bool:
+    current = get_current_job()
+    if current is None:
+        # Синхронный вызов вне воркера — повторов не будет
+        return True
+    return not current.retries_left
+
+
+def _fail_submission(db, job: Job, error: Exception) -> None:
+    """Окончательная ошибка отправки: возвращаем резерв токенов и помечаем задачу failed."""
+    tokens_to_return = 0
+    try:
+        meta = dict(job.meta or {})
+        meta.update({"falError": str(error)})
+        # Резерв возвращаем только тот, кто действительно перевёл задачу в failed
+        if transition_job(db, job.id, "failed", expected="queued", values={"meta": meta}) is None:
+            db.rollback()
+            logger.warning("fal.submit: job already left queued, skip failing job_id=%s", job.id)
+            return
+        tokens_to_return = Decimal(job.tokens_reserved or 0)
+        if tokens_to_return and job.user_id:
+            credit_tokens(db, job.user_id, tokens_to_return)
+        if tokens_to_return:
+            # Оплата токенами возвращена; оплата через шлюз остаётся зафиксированной
+            job.tokens_reserved = 0
+            job.is_paid = False
+        db.commit()
+    except Exception:
+        db.rollback()
+        logger.exception("fal.submit: failed to mark job failed job_id=%s", job.id)
+    logger.error("fal.submit: submission failed job_id=%s tokens_refunded=%s error=%s", job.id, tokens_to_return, error)
+    try:
+        notify_job_event(
+            event="job.failed",
+            job_id=str(job.id),
+            user_id=str(job.user_id) if job.user_id else None,
+            status="failed",
+            service_type=None,
+            message=str(error),
+        )
+    except Exception:
+        logger.exception("notify telegram failed for job_id=%s", job.id)
+
+
+def submit_job_task(job_id: str) -> Dict[str, Any]:
+    """RQ-задача: отправить оплаченную задачу в FAL и сохранить request_id.
+
+    Идемпотентна: задача, у которой уже есть meta.fal.requestId, повторно не отправляется.
+    """
+    db = SessionLocal()
+    try:
+        job = db.query(Job).filter(Job.id == job_id).first()
+        if not job:
+            logger.warning("fal.submit: job not found job_id=%s", job_id)
+            return {"ok": False, "reason": "not_found"}
+        fal_meta = (job.meta or {}).get("fal") if isinstance(job.meta, dict) else None
+        if isinstance(fal_meta, dict) and fal_meta.get("requestId"):
+            logger.info("fal.submit: already submitted job_id=%s request_id=%s", job.id, fal_meta.get("requestId"))
+            return {"ok": True, "request_id": fal_meta.get("requestId"), "skipped": True}
+        if not job.is_paid or job.status != "queued":
+            logger.info("fal.submit: skip job_id=%s is_paid=%s status=%s", job.id, job.is_paid, job.status)
+            return {"ok": False, "reason": "not_queued"}
+        model = db.query(Model).filter(Model.id == job.model_id).first() if job.model_id else None
+        if not model or not is_submittable(model):
+            logger.warning("fal.submit: unsupported model/formats job_id=%s model_id=%s", job.id, job.model_id)
+            return {"ok": False, "reason": "unsupported"}
+
+        fmt_from, fmt_to = format_pair(model)
+        input_objects = job.input if isinstance(job.input, list) else []
+        prompt = extract_prompt_from_input(input_objects) or ((job.meta or {}).get("prompt") if isinstance(job.meta, dict) else None)
+        image_url = extract_image_url(input_objects) if fmt_from == "image" else None
+        endpoint = resolve_fal_endpoint(model)
+        if not job.order_id:
+            job.order_id = str(job.id)
+
+        logger.info(
+            "fal.submit: submitting %s->%s job_id=%s order_id=%s endpoint=%s",
+            fmt_from.upper(),
+            fmt_to.upper(),
+            job.id,
+            job.order_id,
+            endpoint,
+        )
+        try:
+            fal_resp = submit_generation(
+                image_url=image_url,
+                prompt=prompt or DEFAULT_PROMPTS[(fmt_from, fmt_to)],
+                order_id=job.order_id,
+                item_index=0,
+                anon_user_id=None,
+                endpoint=endpoint,
+                extra_args=extract_extra_args(input_objects),
+            )
+        except Exception as e:
+            db.rollback()
+            if _is_final_attempt():
+                _fail_submission(db, job, e)
+            else:
+                logger.warning("fal.submit: attempt failed, will retry job_id=%s error=%s", job.id, e)
+            raise
+
+        meta = dict(job.meta or {})
+        meta.update({
+            "fal": {
+                "requestId": fal_resp.get("request_id"),
+                "modelId": fal_resp.get("model_id"),
+                "webhook": bool(fal_resp.get("webhook")),
+            }
+        })
+        job.meta = meta
+        # Сохраняем request_id FAL в отдельное поле для быстрого доступа поллером
+        if fal_resp.get("request_id"):
+            job.request_id = str(fal_resp.get("request_id"))
+        if fal_resp.get("webhook"):
+            # Результат придёт вебхуком; поллер проверит задачу, только если вебхук запоздает
+            job.next_poll_at = datetime.now(timezone.utc) + timedelta(
+                seconds=typical_runtime_seconds(model) + settings.fal_poll_webhook_grace_seconds
+            )
+        else:
+            # Первая проверка статуса — на ближайшем тике поллера
+            job.next_poll_at = None
+        db.commit()
+        logger.info(
+            "fal.submit: submitted job_id=%s request_id=%s model_id=%s",
+            job.id,
+            fal_resp.get("request_id"),
+            fal_resp.get("model_id"),
+        )
+        return {"ok": True, "request_id": fal_resp.get("request_id")}
+    finally:
+        db.close()
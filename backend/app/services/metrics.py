@@ -0,0 +1,253 @@
+"""Метрики Prometheus конвейера генерации (отдаются на /metrics, доступ по X-API-Key).
+
+При нескольких процессах uvicorn задайте PROMETHEUS_MULTIPROC_DIR (общий каталог для всех
+процессов) — тогда /metrics агрегирует значения со всех воркеров. Отдельный процесс поллера
+отдаёт свои метрики на порту FAL_POLLER_METRICS_PORT.
+"""
+from __future__ import annotations
+
+import logging
+import os
+import threading
+import time
+from contextlib import contextmanager
+from datetime import datetime, timezone
+from typing import Any, Iterator, Optional
+
+from prometheus_client import (
+    CONTENT_TYPE_LATEST,
+    CollectorRegistry,
+    Counter,
+    Histogram,
+    generate_latest,
+)
+from prometheus_client.core import GaugeMetricFamily, REGISTRY
+from prometheus_client.registry import Collector
+
+
+logger = logging.getLogger(__name__)
+
+_LATENCY_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120)
+_JOB_LATENCY_BUCKETS = (5, 10, 30, 60, 120, 180, 300, 600, 900, 1800, 3600)
+
+POLL_TICK_SECONDS = Histogram(
+    "fal_poll_tick_seconds",
+    "Длительность тика поллера FAL",
+    buckets=_LATENCY_BUCKETS,
+)
+POLL_JOBS_CHECKED = Counter(
+    "fal_poll_jobs_checked_total",
+    "Задачи, по которым поллер запрашивал статус в FAL",
+)
+FAL_REQUEST_SECONDS = Histogram(
+    "fal_request_seconds",
+    "Латентность запросов к FAL по операции и эндпоинту",
+    ["operation", "endpoint"],
+    buckets=_LATENCY_BUCKETS,
+)
+FAL_REQUEST_ERRORS = Counter(
+    "fal_request_errors_total",
+    "Ошибки запросов к FAL по операции и эндпоинту",
+    ["operation", "endpoint"],
+)
+MEDIA_TRANSFER_BYTES = Counter(
+    "media_transfer_bytes_total",
+    "Байты результатов, перекачанных в S3, по направлению",
+    ["kind"],
+)
+MEDIA_TRANSFER_SECONDS = Histogram(
+    "media_transfer_seconds",
+    "Длительность перекачки результата в S3",
+    ["kind"],
+    buckets=_LATENCY_BUCKETS,
+)
+MEDIA_TRANSFER_THROUGHPUT = Histogram(
+    "media_transfer_throughput_bytes_per_second",
+    "Скорость перекачки результата в S3",
+    ["kind"],
+    buckets=(2**18, 2**19, 2**20, 2**21, 2**22, 2**23, 2**24, 2**25, 2**26, 2**27),
+)
+NOTIFICATION_SECONDS = Histogram(
+    "job_notification_seconds",
+    "Латентность уведомления пользователя о результате по каналу",
+    ["channel", "event"],
+    buckets=_LATENCY_BUCKETS,
+)
+DB_POOL_WAIT_SECONDS = Histogram(
+    "db_pool_wait_seconds",
+    "Ожидание соединения из пула БД",
+    ["pool"],
+    buckets=(0.001, 0.005, 0.01, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30),
+)
+DB_POOL_REJECTED = Counter(
+    "db_pool_rejected_total",
+    "Отказы в соединении из пула БД: timeout — истёк pool_timeout, waiters — очередь ожидающих полна",
+    ["pool", "reason"],
+)
+JOB_END_TO_END_SECONDS = Histogram(
+    "job_end_to_end_seconds",
+    "Время от создания задачи (created_at) до статуса done по модели",
+    ["model"],
+    buckets=_JOB_LATENCY_BUCKETS,
+)
+
+
+@contextmanager
+def observe_fal_request(operation: str, endpoint: Optional[str]) -> Iterator[None]:
+    """Засечь латентность запроса к FAL и посчитать ошибку, если он упал."""
+    labels = {"operation": operation, "endpoint": endpoint or "unknown"}
+    start = time.perf_counter()
+    try:
+        yield
+    except Exception:
+        FAL_REQUEST_ERRORS.labels(**labels).inc()
+        raise
+    finally:
+        FAL_REQUEST_SECONDS.labels(**labels).observe(time.perf_counter() - start)
+
+
+def observe_media_transfer(kind: str, nbytes: int, seconds: float) -> None:
+    MEDIA_TRANSFER_BYTES.labels(kind=kind).inc(nbytes)
+    MEDIA_TRANSFER_SECONDS.labels(kind=kind).observe(seconds)
+    if seconds > 0 and nbytes:
+        MEDIA_TRANSFER_THROUGHPUT.labels(kind=kind).observe(nbytes / seconds)
+
+
+def observe_job_done(model: Optional[str], created_at: Optional[datetime]) -> None:
+    if created_at is None:
+        return
+    if created_at.tzinfo is None:
+        created_at = created_at.replace(tzinfo=timezone.utc)
+    elapsed = (datetime.now(timezone.utc) - created_at).total_seconds()
+    if elapsed >= 0:
+        JOB_END_TO_END_SECONDS.labels(model=model or "unknown").observe(elapsed)
+
+
+def model_label(model_id: Any) -> Optional[str]:
+    """Имя модели для метки по id (из кэша каталога, без запроса в БД на горячем пути)."""
+    if not model_id:
+        return None
+    try:
+        from app.services.catalog import get_catalog
+
+        model = get_catalog().model_by_id(model_id)
+    except Exception:
+        model = None
+    return getattr(model, "name", None) or str(model_id)
+
+
+class PipelineCollector(Collector):
+    """Метрики, снимаемые в момент скрейпа: активные задачи по статусам и кэш presigned-ссылок.
+
+    Счётчик активных задач — запрос в БД, поэтому он кэшируется на METRICS_ACTIVE_JOBS_TTL_SECONDS
+    и пересчитывается одним скрейпом за раз: частые или параллельные скрейпы не нагружают БД.
+    """
+
+    _ACTIVE_STATUSES = ("waiting_payment", "queued", "processing")
+
+    def __init__(self, ttl_seconds: Optional[float] = None) -> None:
+        from app.core.config import settings
+
+        self.ttl_seconds = float(settings.metrics_active_jobs_ttl_seconds if ttl_seconds is None else ttl_seconds)
+        self._lock = threading.Lock()
+        self._counts: Optional[dict[str, int]] = None
+        self._counted_at = 0.0
+
+    def describe(self):
+        # Без describe реестр вызвал бы collect (запрос в БД) прямо при регистрации на старте
+        return []
+
+    def _active_counts(self) -> dict[str, int]:
+        with self._lock:
+            if self._counts is not None and time.monotonic() - self._counted_at < self.ttl_seconds:
+                return self._counts
+            from sqlalchemy import func
+
+            from app.database import ReadSessionLocal
+            from app.db.models import Job
+
+            db = ReadSessionLocal()
+            try:
+                self._counts = dict(
+                    db.query(Job.status, func.count(Job.id))
+                    .filter(Job.status.in_(self._ACTIVE_STATUSES))
+                    .group_by(Job.status)
+                    .all()
+                )
+            finally:
+                db.close()
+            self._counted_at = time.monotonic()
+            return self._counts
+
+    def collect(self):
+        active = GaugeMetricFamily("jobs_active", "Незавершённые задачи по статусу", labels=["status"])
+        try:
+            counts = self._active_counts()
+            for status in self._ACTIVE_STATUSES:
+                active.add_metric([status], counts.get(status, 0))
+            yield active
+        except Exception:
+            logger.exception("metrics: failed to count active jobs")
+
+        from app.services.s3_utils import presign_cache_stats
+
+        presign = GaugeMetricFamily("s3_presign_cache", "Кэш presigned-ссылок S3 (в этом процессе)", labels=["stat"])
+        for stat, value in presign_cache_stats().items():
+            if isinstance(value, (int, float)):
+                presign.add_metric([stat], value)
+        yield presign
+
+
+class PoolCollector(Collector):
+    """Состояние пулов соединений БД этого процесса (снимается в момент скрейпа, без запросов в БД)."""
+
+    def describe(self):
+        # Без describe реестр вызвал бы collect при регистрации — до инициализации app.database
+        return []
+
+    def collect(self):
+        from app.database import INSTRUMENTED_POOLS
+
+        size = GaugeMetricFamily("db_pool_size", "Постоянный размер пула БД", labels=["pool"])
+        checked_out = GaugeMetricFamily("db_pool_checked_out", "Выданные соединения пула БД", labels=["pool"])
+        overflow = GaugeMetricFamily("db_pool_overflow", "Соединения сверх pool_size", labels=["pool"])
+        waiting = GaugeMetricFamily("db_pool_waiting", "Запросы, ждущие соединение из пула БД", labels=["pool"])
+        for pool in list(INSTRUMENTED_POOLS):
+            label = [pool.label]
+            size.add_metric(label, pool.size())
+            checked_out.add_metric(label, pool.checkedout())
+            overflow.add_metric(label, max(0, pool.overflow()))
+            waiting.add_metric(label, pool.waiting)
+        yield size
+        yield checked_out
+        yield overflow
+        yield waiting
+
+
+# Пулы есть в каждом процессе (API, поллер, воркер), поэтому коллектор подключается сразу
+REGISTRY.register(PoolCollector())
+
+_pipeline_collector_registered = False
+
+
+def register_pipeline_collector() -> None:
+    """Подключить PipelineCollector к реестру по умолчанию (один раз на процесс, только в API)."""
+    global _pipeline_collector_registered
+    if not _pipeline_collector_registered:
+        REGISTRY.register(PipelineCollector())
+        _pipeline_collector_registered = True
+
+
+def render_metrics() -> tuple[bytes, str]:
+    """Тело ответа /metrics и его Content-Type."""
+    if os.environ.get("PROMETHEUS_MULTIPROC_DIR"):
+        from prometheus_client import multiprocess
+
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+        # Снимаемые при скрейпе метрики не пишутся в файлы multiprocess — добавляем их отдельно
+        # (пулы и кэш — только процесса, обслуживающего скрейп)
+        registry.register(PipelineCollector())
+        registry.register(PoolCollector())
+        return generate_latest(registry), CONTENT_TYPE_LATEST
+    return generate_latest(REGISTRY), CONTENT_TYPE_LATEST
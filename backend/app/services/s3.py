@@ -1,25 +1,73 @@
 from __future__ import annotations
 
-from typing import Optional
+import logging
+import threading
+import time
+from typing import Any, Optional
 import boto3
 from botocore.client import Config
 from app.core.config import settings
 
 
-def get_s3_client():
-    return boto3.client(
-        "s3",
-        endpoint_url=settings.s3_endpoint_url,
-        aws_access_key_id=settings.s3_access_key_id,
-        aws_secret_access_key=settings.s3_secret_access_key,
-        region_name=settings.s3_region_name,
-        config=Config(s3={"addressing_style": "path"}),
+logger = logging.getLogger(__name__)
+
+# Клиенты boto3 потокобезопасны, поэтому держим по одному на процесс (на каждый addressing style)
+# и переиспользуем их пул keep-alive соединений во всех загрузках и пресайнах.
+_clients: dict[str, Any] = {}
+_clients_lock = threading.Lock()
+_session: Optional[boto3.session.Session] = None
+
+
+def _client_config(addressing_style: str) -> Config:
+    return Config(
+        s3={"addressing_style": addressing_style},
+        max_pool_connections=settings.s3_max_pool_connections,
+        retries={"max_attempts": settings.s3_max_retries, "mode": "standard"},
+        connect_timeout=settings.s3_connect_timeout_seconds,
+        read_timeout=settings.s3_read_timeout_seconds,
+        tcp_keepalive=True,
     )
 
 
+def get_s3_client(addressing_style: str = "path"):
+    client = _clients.get(addressing_style)
+    if client is not None:
+        return client
+    global _session
+    with _clients_lock:
+        client = _clients.get(addressing_style)
+        if client is None:
+            start_ts = time.perf_counter()
+            if _session is None:
+                _session = boto3.session.Session()
+            client = _session.client(
+                "s3",
+                endpoint_url=settings.s3_endpoint_url,
+                aws_access_key_id=settings.s3_access_key_id,
+                aws_secret_access_key=settings.s3_secret_access_key,
+                region_name=settings.s3_region_name,
+                config=_client_config(addressing_style),
+            )
+            _clients[addressing_style] = client
+            logger.info(
+                "s3: client created addressing_style=%s max_pool_connections=%s elapsed_ms=%s",
+                addressing_style,
+                settings.s3_max_pool_connections,
+                int((time.perf_counter() - start_ts) * 1000),
+            )
+    return client
+
+
+def warmup_s3_clients() -> None:
+    """Создать общие клиенты заранее (на старте), чтобы первый запрос не платил за инициализацию."""
+    start_ts = time.perf_counter()
+    for style in ("path", "auto"):
+        get_s3_client(style)
+    logger.info("s3: clients warmed up elapsed_ms=%s", int((time.perf_counter() - start_ts) * 1000))
+
+
 def upload_bytes(key: str, data: bytes, content_type: Optional[str] = None) -> str:
     s3 = get_s3_client()
     extra = {"ContentType": content_type} if content_type else None
     s3.put_object(Bucket=settings.s3_bucket_name, Key=key, Body=data, **({} if not extra else extra))
     return f"s3://{settings.s3_bucket_name}/{key}"
-
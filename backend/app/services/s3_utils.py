@@ -1,19 +1,18 @@
 import os
 import mimetypes
-from typing import BinaryIO, Optional
-import boto3
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import BinaryIO, Iterable, Optional
 
 from app.core.config import settings
+from app.services.s3 import get_s3_client
 
 
 def _s3_client():
-	return boto3.client(
-		"s3",
-		endpoint_url=settings.s3_endpoint_url,
-		aws_access_key_id=settings.s3_access_key_id,
-		aws_secret_access_key=settings.s3_secret_access_key,
-		region_name=settings.s3_region_name,
-	)
+	# Общий для процесса клиент (см. app.services.s3); addressing style по умолчанию boto3
+	return get_s3_client("auto")
 
 
 def s3_key_for_upload(anon_user_id: str, request_id: str, filename: str) -> str:
@@ -30,14 +29,174 @@ def upload_bytes(bucket: str, key: str, data: bytes, content_type: Optional[str]
 	client.put_object(Bucket=bucket, Key=key, Body=data, ContentType=ct)
 
 
-def presigned_get_url(bucket: str, key: str, expires: Optional[int] = None) -> str:
+# Минимальный размер части multipart-загрузки в S3 (кроме последней)
+MIN_MULTIPART_PART_SIZE = 5 * 1024 * 1024
+
+
+def upload_stream(
+	bucket: str,
+	key: str,
+	chunks: Iterable[bytes],
+	content_type: Optional[str] = None,
+	part_size: Optional[int] = None,
+	max_concurrency: Optional[int] = None,
+) -> int:
+	"""Потоковая загрузка в S3 из итератора чанков без буферизации всего файла.
+
+	Данные нарезаются на части по part_size и отправляются multipart-загрузкой,
+	до max_concurrency частей параллельно. Чтение источника блокируется, пока
+	в полёте max_concurrency частей, поэтому память ограничена
+	part_size × (max_concurrency + 1). Если весь поток уместился в одну часть —
+	делаем обычный put_object. Возвращает количество записанных байт.
+	"""
 	client = _s3_client()
+	ct = content_type or mimetypes.guess_type(key)[0] or "application/octet-stream"
+	size = max(int(part_size or settings.s3_multipart_part_size_mb * 1024 * 1024), MIN_MULTIPART_PART_SIZE)
+	concurrency = max(1, int(max_concurrency or settings.s3_multipart_concurrency))
+
+	buf = bytearray()
+	total = 0
+	upload_id: Optional[str] = None
+	futures: list[Future] = []
+	slots = threading.BoundedSemaphore(concurrency)
+	executor: Optional[ThreadPoolExecutor] = None
+
+	def _upload_part(part_number: int, body: bytes) -> dict:
+		try:
+			resp = client.upload_part(Bucket=bucket, Key=key, UploadId=upload_id, PartNumber=part_number, Body=body)
+			return {"PartNumber": part_number, "ETag": resp["ETag"]}
+		finally:
+			slots.release()
+
+	def _submit(body: bytes) -> None:
+		nonlocal upload_id, executor
+		if upload_id is None:
+			upload_id = client.create_multipart_upload(Bucket=bucket, Key=key, ContentType=ct)["UploadId"]
+			executor = ThreadPoolExecutor(max_workers=concurrency, thread_name_prefix="s3-part")
+		# Ждём свободный слот — так источник не читается быстрее, чем уходят части
+		slots.acquire()
+		futures.append(executor.submit(_upload_part, len(futures) + 1, body))
+
+	try:
+		for chunk in chunks:
+			if not chunk:
+				continue
+			buf.extend(chunk)
+			total += len(chunk)
+			while len(buf) >= size:
+				_submit(bytes(buf[:size]))
+				del buf[:size]
+		if upload_id is None:
+			client.put_object(Bucket=bucket, Key=key, Body=bytes(buf), ContentType=ct)
+			return total
+		if buf:
+			_submit(bytes(buf))
+			buf = bytearray()
+		parts = [f.result() for f in futures]
+		client.complete_multipart_upload(
+			Bucket=bucket,
+			Key=key,
+			UploadId=upload_id,
+			MultipartUpload={"Parts": parts},
+		)
+		return total
+	except Exception:
+		if upload_id is not None:
+			for f in futures:
+				f.cancel()
+			try:
+				client.abort_multipart_upload(Bucket=bucket, Key=key, UploadId=upload_id)
+			except Exception:
+				pass
+		raise
+	finally:
+		if executor is not None:
+			executor.shutdown(wait=True)
+
+
+class PresignCache:
+	"""LRU-кэш presigned GET-ссылок по ключу (bucket, key, ttl) с учётом срока действия.
+
+	Ссылка отдаётся из кэша, пока у неё осталось не меньше min_validity_ratio от исходного TTL;
+	иначе запись считается устаревшей и ссылка подписывается заново.
+	"""
+
+	def __init__(self, max_size: int, min_validity_ratio: float) -> None:
+		self.max_size = max(0, int(max_size))
+		self.min_validity_ratio = min(max(float(min_validity_ratio), 0.0), 1.0)
+		self._items: "OrderedDict[tuple[str, str, int], tuple[str, float]]" = OrderedDict()
+		self._lock = threading.Lock()
+		self.hits = 0
+		self.misses = 0
+		self.evictions = 0
+
+	def get(self, bucket: str, key: str, ttl: int) -> Optional[tuple[str, int]]:
+		"""Вернуть (url, оставшиеся секунды) или None, если ссылки нет или она скоро истечёт."""
+		cache_key = (bucket, key, ttl)
+		now = time.monotonic()
+		with self._lock:
+			item = self._items.get(cache_key)
+			if item is not None:
+				url, expires_at = item
+				remaining = expires_at - now
+				if remaining >= ttl * self.min_validity_ratio:
+					self._items.move_to_end(cache_key)
+					self.hits += 1
+					return url, int(remaining)
+				del self._items[cache_key]
+			self.misses += 1
+			return None
+
+	def put(self, bucket: str, key: str, ttl: int, url: str, signed_at: float) -> None:
+		if self.max_size <= 0:
+			return
+		cache_key = (bucket, key, ttl)
+		with self._lock:
+			self._items[cache_key] = (url, signed_at + ttl)
+			self._items.move_to_end(cache_key)
+			while len(self._items) > self.max_size:
+				self._items.popitem(last=False)
+				self.evictions += 1
+
+	def stats(self) -> dict:
+		with self._lock:
+			total = self.hits + self.misses
+			return {
+				"size": len(self._items),
+				"maxSize": self.max_size,
+				"hits": self.hits,
+				"misses": self.misses,
+				"evictions": self.evictions,
+				"hitRatio": (self.hits / total) if total else 0.0,
+			}
+
+
+_presign_cache = PresignCache(settings.s3_presign_cache_size, settings.s3_presign_cache_min_validity_ratio)
+
+
+def presign_cache_stats() -> dict:
+	"""Метрики кэша presigned-ссылок (hits/misses/evictions/size)."""
+	return _presign_cache.stats()
+
+
+def _presign_with_expiry(bucket: str, key: str, expires: Optional[int] = None) -> tuple[str, int]:
 	exp = expires or settings.s3_presign_ttl_seconds
-	return client.generate_presigned_url(
+	cached = _presign_cache.get(bucket, key, exp)
+	if cached is not None:
+		return cached
+	# Засекаем время до подписи, чтобы не переоценить срок жизни ссылки
+	signed_at = time.monotonic()
+	url = _s3_client().generate_presigned_url(
 		"get_object",
 		Params={"Bucket": bucket, "Key": key},
 		ExpiresIn=exp,
 	)
+	_presign_cache.put(bucket, key, exp, url, signed_at)
+	return url, exp
+
+
+def presigned_get_url(bucket: str, key: str, expires: Optional[int] = None) -> str:
+	return _presign_with_expiry(bucket, key, expires)[0]
 
 
 def get_file_url(bucket: str, key: str, expires: Optional[int] = None) -> str:
@@ -46,9 +205,8 @@ def get_file_url(bucket: str, key: str, expires: Optional[int] = None) -> str:
 
 
 def get_file_url_with_expiry(bucket: str, key: str, expires: Optional[int] = None) -> tuple[str, int]:
-	"""Возвращает (url, expires_in секунд)."""
-	exp = expires or settings.s3_presign_ttl_seconds
-	return presigned_get_url(bucket, key, exp), exp
+	"""Возвращает (url, expires_in секунд). Для ссылки из кэша expires_in — оставшийся срок действия."""
+	return _presign_with_expiry(bucket, key, expires)
 
 
 def get_files_url(bucket: str, object_names: list[str], expires: Optional[int] = None) -> list[str]:
@@ -1,44 +1,258 @@
 from __future__ import annotations
 
+import logging
 import subprocess
 import tempfile
+import time
 from pathlib import Path
-from typing import Any
+from typing import Any, Iterator, Optional
+
+from app.core.config import settings
+
+
+logger = logging.getLogger(__name__)
+
+# Размер чанка при чтении результата ffmpeg для потоковой загрузки в S3
+_READ_CHUNK_SIZE = 1024 * 1024
 
 
 def run_cmd(cmd: list[str]) -> None:
     subprocess.check_call(cmd)
 
 
-def append_black_tail(input_path: str, output_path: str, width: int = 1920, height: int = 1080, tail_seconds: int = 3) -> None:
+def default_transforms() -> dict[str, Any]:
+    return {
+        "tail_seconds": settings.postprocess_tail_seconds,
+        "watermark_text": settings.postprocess_watermark_text,
+        "height": settings.postprocess_height,
+        "thumbnail": settings.postprocess_thumbnail,
+    }
+
+
+def probe_has_audio(input_url: str) -> bool:
+    """Есть ли во входе звуковая дорожка (ffprobe читает только заголовки)."""
+    out = subprocess.check_output([
+        "ffprobe",
+        "-v", "error",
+        "-select_streams", "a",
+        "-show_entries", "stream=index",
+        "-of", "csv=p=0",
+        input_url,
+    ])
+    return bool(out.strip())
+
+
+def build_filter_graph(transforms: dict[str, Any]) -> tuple[str, Optional[str], Optional[str]]:
+    """Собрать единый filter_complex для всех преобразований.
+
+    Возвращает (граф, метка миниатюры или None, метка звука или None). Видео-выход графа всегда
+    помечен [vout]; звук проходит через граф, только если его нужно дополнить под хвост.
+    """
+    tail_seconds = int(transforms.get("tail_seconds") or 0)
+    # Текст водяного знака читаем из файла (textfile=), чтобы не экранировать его в графе
+    watermark_textfile = transforms.get("watermark_textfile")
+    height = int(transforms.get("height") or 0)
+
+    base_steps: list[str] = []
+    if height > 0:
+        base_steps.append(f"scale=-2:{height}")
+    base_steps.append("setsar=1")
+    if watermark_textfile:
+        base_steps.append(
+            f"drawtext=textfile={watermark_textfile}"
+            ":x=w-tw-24:y=h-th-24:fontsize=h/24:fontcolor=white@0.85"
+            ":box=1:boxcolor=black@0.35:boxborderw=8"
+        )
+    graph = [f"[0:v]{','.join(base_steps)}[base]"]
+    current = "base"
+
+    if tail_seconds > 0:
+        # Чёрный хвост дописываем в том же графе (tpad), без отдельного ролика и concat
+        graph.append(f"[{current}]tpad=stop_mode=add:stop_duration={tail_seconds}:color=black[padded]")
+        current = "padded"
+
+    audio_label: Optional[str] = None
+    if tail_seconds > 0 and transforms.get("has_audio"):
+        # Звук дополняется тишиной на длину хвоста; лишнее обрежет -shortest по видео
+        graph.append("[0:a]apad[aout]")
+        audio_label = "aout"
+
+    thumb_label: Optional[str] = None
+    if transforms.get("thumbnail"):
+        graph.append(f"[{current}]split=2[vout][thsrc]")
+        graph.append("[thsrc]thumbnail=50,scale=-2:360[thumb]")
+        thumb_label = "thumb"
+    else:
+        graph.append(f"[{current}]null[vout]")
+    return ";".join(graph), thumb_label, audio_label
+
+
+def build_ffmpeg_command(
+    input_url: str,
+    output_path: str,
+    transforms: dict[str, Any],
+    thumbnail_path: Optional[str] = None,
+) -> list[str]:
+    """Одна команда ffmpeg: чтение входа потоком по URL, все преобразования, видео и миниатюра."""
+    graph, thumb_label, audio_label = build_filter_graph(transforms)
+    cmd = [
+        "ffmpeg",
+        "-hide_banner",
+        "-loglevel", "error",
+        "-y",
+        "-i", input_url,
+        "-filter_complex", graph,
+        "-map", "[vout]",
+        "-map", f"[{audio_label}]" if audio_label else "0:a?",
+        "-c:v", "libx264",
+        "-preset", str(transforms.get("preset") or settings.postprocess_preset),
+        "-crf", str(transforms.get("crf") or settings.postprocess_crf),
+        "-pix_fmt", "yuv420p",
+        "-c:a", "aac",
+    ]
+    if audio_label:
+        cmd.append("-shortest")
+    cmd += ["-movflags", "+faststart", output_path]
+    if thumb_label and thumbnail_path:
+        cmd += ["-map", f"[{thumb_label}]", "-frames:v", "1", "-q:v", "3", thumbnail_path]
+    return cmd
+
+
+def append_black_tail(input_path: str, output_path: str, tail_seconds: int = 3) -> None:
+    # Один проход ffmpeg без промежуточного файла с чёрным роликом; хвост берёт размер кадра входа
+    transforms = {"tail_seconds": tail_seconds, "thumbnail": False, "has_audio": probe_has_audio(input_path)}
+    run_cmd(build_ffmpeg_command(input_path, output_path, transforms))
+
+
+def _iter_file(path: Path) -> Iterator[bytes]:
+    with open(path, "rb") as f:
+        while True:
+            chunk = f.read(_READ_CHUNK_SIZE)
+            if not chunk:
+                break
+            yield chunk
+
+
+def enqueue_postprocess(job_id: str, bucket: str, key: str) -> bool:
+    """Поставить постобработку готового результата в очередь RQ (если включена).
+
+    Возвращает True, если задача поставлена: тогда пользователя уведомит process_run_job.
+    """
+    if not settings.postprocess_enabled:
+        return False
+    from app.services.queue import get_queue
+
+    try:
+        get_queue(settings.postprocess_queue_name).enqueue(
+            process_run_job,
+            {"job_id": str(job_id), "bucket": bucket, "s3_key": key},
+            job_id=f"postprocess-{job_id}",
+            job_timeout=settings.postprocess_job_timeout_seconds,
+        )
+        logger.info("postprocess: enqueued job_id=%s key=%s", job_id, key)
+        return True
+    except Exception:
+        logger.exception("postprocess: enqueue failed job_id=%s", job_id)
+        return False
+
+
+def _transform_and_upload(bucket: str, src_key: str, transforms: dict[str, Any]) -> dict[str, Any]:
+    """Один проход ffmpeg и загрузка результата (и миниатюры) в S3; возвращает ключи, размер и тайминги."""
+    from app.services.metrics import observe_media_transfer
+    from app.services.s3_utils import get_file_url_with_expiry, upload_stream
+
+    stem = src_key.rsplit(".", 1)[0]
+    out_key = f"{stem}_processed.mp4"
+    thumb_key: Optional[str] = None
+    timings: dict[str, int] = {}
+    total_start = time.perf_counter()
     with tempfile.TemporaryDirectory() as tmpd:
-        black_path = Path(tmpd) / "black.mp4"
-        run_cmd(["ffmpeg", "-y", "-f", "lavfi", "-i", f"color=size={width}x{height}:duration={tail_seconds}:color=black", str(black_path)])
-        run_cmd([
-            "ffmpeg",
-            "-y",
-            "-i",
-            input_path,
-            "-i",
-            str(black_path),
-            "-filter_complex",
-            "[0:v][1:v]concat=n=2:v=1:a=0[outv]",
-            "-map",
-            "[outv]",
-            "-c:v",
-            "libx264",
-            output_path,
-        ])
+        out_path = Path(tmpd) / "out.mp4"
+        thumb_path = Path(tmpd) / "thumb.jpg"
+        if transforms.get("watermark_text"):
+            watermark_path = Path(tmpd) / "watermark.txt"
+            watermark_path.write_text(str(transforms["watermark_text"]), encoding="utf-8")
+            transforms["watermark_textfile"] = str(watermark_path)
+        input_url, _ = get_file_url_with_expiry(bucket, src_key)
+
+        if int(transforms.get("tail_seconds") or 0) > 0:
+            t0 = time.perf_counter()
+            transforms["has_audio"] = probe_has_audio(input_url)
+            timings["probe_ms"] = int((time.perf_counter() - t0) * 1000)
+
+        t0 = time.perf_counter()
+        run_cmd(build_ffmpeg_command(input_url, str(out_path), transforms, str(thumb_path)))
+        timings["transform_ms"] = int((time.perf_counter() - t0) * 1000)
+
+        t0 = time.perf_counter()
+        out_bytes = upload_stream(bucket, out_key, _iter_file(out_path), content_type="video/mp4")
+        observe_media_transfer("postprocess_upload", out_bytes, time.perf_counter() - t0)
+        timings["upload_ms"] = int((time.perf_counter() - t0) * 1000)
+
+        if transforms.get("thumbnail") and thumb_path.exists():
+            t0 = time.perf_counter()
+            thumb_key = f"{stem}_thumb.jpg"
+            upload_stream(bucket, thumb_key, _iter_file(thumb_path), content_type="image/jpeg")
+            timings["thumbnail_upload_ms"] = int((time.perf_counter() - t0) * 1000)
+    timings["total_ms"] = int((time.perf_counter() - total_start) * 1000)
+    return {"out_key": out_key, "thumb_key": thumb_key, "bytes": out_bytes, "timings": timings}
 
 
 def process_run_job(payload: dict[str, Any]) -> dict[str, Any]:
-    # payload: job_id, user_id, model_name, prompt, duration_seconds, audio, input_url(s)
-    # Заглушка: берём входной файл (не скачиваем), прогоняем постобработку и возвращаем фиктивный s3_key
-    with tempfile.TemporaryDirectory() as tmpd:
-        inp = Path(tmpd) / "in.mp4"
-        outp = Path(tmpd) / "out.mp4"
-        # создаём короткий цветной ролик как заглушку "входа"
-        run_cmd(["ffmpeg", "-y", "-f", "lavfi", "-i", "color=size=1920x1080:duration=1:color=blue", str(inp)])
-        append_black_tail(str(inp), str(outp))
-    return {"ok": True, "s3_key": "results/stub.mp4"}
+    """RQ-задача постобработки готового видео.
+
+    payload: job_id, s3_key, bucket (опционально), transforms (опционально, поверх настроек).
+    Вход ffmpeg читает потоком по presigned-ссылке, результат пишется во временный файл
+    (mp4 с +faststart требует seek) и загружается в S3 multipart-загрузкой. Обработанный файл
+    становится result_url задачи, тайминги этапов пишутся в Job.postprocess_timings.
+    Уведомление о готовности отправляется отсюда — уже со ссылкой на обработанный файл,
+    а если постобработка упала — с исходным результатом.
+    """
+    from app.database import SessionLocal
+    from app.db.models import Job
+    from app.services.job_completion import notify_completion
+    from app.services.s3_utils import get_file_url_with_expiry
+
+    job_id = str(payload["job_id"])
+    bucket = payload.get("bucket") or settings.s3_bucket_name or ""
+    src_key = payload["s3_key"]
+    transforms = {**default_transforms(), **(payload.get("transforms") or {})}
+
+    db = SessionLocal()
+    try:
+        try:
+            processed = _transform_and_upload(bucket, src_key, transforms)
+        except Exception:
+            logger.exception("postprocess: failed job_id=%s key=%s, announcing source result", job_id, src_key)
+            job = db.query(Job).filter(Job.id == job_id).first()
+            if job and job.result_url:
+                notify_completion(job, job.result_url)
+            raise
 
+        out_key, thumb_key, timings = processed["out_key"], processed["thumb_key"], processed["timings"]
+        result_url, _ = get_file_url_with_expiry(bucket, out_key)
+        thumb_url = get_file_url_with_expiry(bucket, thumb_key)[0] if thumb_key else None
+        job = db.query(Job).filter(Job.id == job_id).first()
+        if job:
+            meta = dict(job.meta or {})
+            meta["postprocess"] = {
+                "sourceKey": src_key,
+                "resultKey": out_key,
+                "thumbnailKey": thumb_key,
+                "transforms": {k: v for k, v in transforms.items() if k not in ("watermark_textfile", "has_audio")},
+                "bytes": processed["bytes"],
+            }
+            job.meta = meta
+            job.postprocess_timings = timings
+            job.result_url = result_url
+            output = list(job.output or []) if isinstance(job.output, list) else []
+            output.append({"type": "video", "s3_url": f"s3://{bucket}/{out_key}", "url": result_url})
+            if thumb_url:
+                output.append({"type": "image", "name": "thumbnail", "s3_url": f"s3://{bucket}/{thumb_key}", "url": thumb_url})
+            job.output = output
+            db.commit()
+            notify_completion(job, result_url)
+    finally:
+        db.close()
+    logger.info("postprocess: done job_id=%s key=%s timings=%s", job_id, out_key, timings)
+    return {"ok": True, "s3_key": out_key, "thumbnail_key": thumb_key, "timings": timings}
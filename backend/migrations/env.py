@@ -0,0 +1,47 @@
+"""Окружение alembic: то же подключение к мастеру, что и у приложения (app.database.engine).
+
+Схема до введения миграций создавалась через Base.metadata.create_all, поэтому ревизии
+написаны идемпотентно (IF NOT EXISTS) и применимы как к старой, так и к свежесозданной БД.
+"""
+from logging.config import fileConfig
+
+from alembic import context
+
+from app.database import engine
+from app.db.models import Base
+
+
+config = context.config
+if config.config_file_name is not None:
+    fileConfig(config.config_file_name)
+
+target_metadata = Base.metadata
+
+
+def run_migrations_offline() -> None:
+    """alembic upgrade head --sql: вывести SQL без подключения к БД."""
+    context.configure(
+        url=engine.url.render_as_string(hide_password=True),
+        target_metadata=target_metadata,
+        literal_binds=True,
+        transaction_per_migration=True,
+    )
+    with context.begin_transaction():
+        context.run_migrations()
+
+
+def run_migrations_online() -> None:
+    with engine.connect() as connection:
+        context.configure(
+            connection=connection,
+            target_metadata=target_metadata,
+            transaction_per_migration=True,
+        )
+        with context.begin_transaction():
+            context.run_migrations()
+
+
+if context.is_offline_mode():
+    run_migrations_offline()
+else:
+    run_migrations_online()
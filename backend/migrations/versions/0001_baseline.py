@@ -0,0 +1,22 @@
+"""baseline: схема, созданная Base.metadata.create_all до введения миграций
+
+Существующую БД достаточно довести до head: ревизии ниже идемпотентны.
+
+Revision ID: 0001
+Revises:
+Create Date: 2026-10-18
+"""
+
+
+revision = "0001"
+down_revision = None
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    pass
+
+
+def downgrade() -> None:
+    pass
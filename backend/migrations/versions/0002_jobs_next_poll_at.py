@@ -0,0 +1,45 @@
+"""jobs.next_poll_at и частичный индекс очереди поллера
+
+Индекс строится CONCURRENTLY, чтобы не блокировать запись в jobs. Если прошлая попытка
+оборвалась и оставила невалидный индекс, он удаляется и строится заново.
+
+Revision ID: 0002
+Revises: 0001
+Create Date: 2026-10-18
+"""
+from alembic import op
+
+
+revision = "0002"
+down_revision = "0001"
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    # NULL — «проверить как можно скорее»: активные задачи попадут на ближайший тик поллера
+    op.execute("ALTER TABLE jobs ADD COLUMN IF NOT EXISTS next_poll_at TIMESTAMP WITH TIME ZONE")
+    with op.get_context().autocommit_block():
+        op.execute(
+            """
+            DO $$
+            BEGIN
+                IF EXISTS (
+                    SELECT 1 FROM pg_index i JOIN pg_class c ON c.oid = i.indexrelid
+                    WHERE c.relname = 'ix_jobs_active_next_poll' AND NOT i.indisvalid
+                ) THEN
+                    DROP INDEX ix_jobs_active_next_poll;
+                END IF;
+            END $$
+            """
+        )
+        op.execute(
+            "CREATE INDEX CONCURRENTLY IF NOT EXISTS ix_jobs_active_next_poll ON jobs (next_poll_at) "
+            "WHERE is_paid AND status IN ('queued', 'processing')"
+        )
+
+
+def downgrade() -> None:
+    with op.get_context().autocommit_block():
+        op.execute("DROP INDEX CONCURRENTLY IF EXISTS ix_jobs_active_next_poll")
+    op.execute("ALTER TABLE jobs DROP COLUMN IF EXISTS next_poll_at")
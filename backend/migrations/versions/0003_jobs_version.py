@@ -0,0 +1,23 @@
+"""jobs.version для compare-and-set смены статуса (app.services.job_state)
+
+С DEFAULT-константой PostgreSQL 11+ добавляет NOT NULL-колонку без перезаписи таблицы.
+
+Revision ID: 0003
+Revises: 0002
+Create Date: 2026-10-18
+"""
+from alembic import op
+
+
+revision = "0003"
+down_revision = "0002"
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.execute("ALTER TABLE jobs ADD COLUMN IF NOT EXISTS version INTEGER NOT NULL DEFAULT 1")
+
+
+def downgrade() -> None:
+    op.execute("ALTER TABLE jobs DROP COLUMN IF EXISTS version")
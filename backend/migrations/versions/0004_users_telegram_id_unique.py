@@ -0,0 +1,77 @@
+"""уникальный индекс users.telegram_id (ключ upsert'а в app.services.identity)
+
+Раньше register-or-login искал пользователя и создавал его отдельными запросами, поэтому у одного
+telegram_id могли появиться дубли. Перед построением индекса остаётся только самый ранний
+пользователь, у остальных telegram_id обнуляется. Пары (дубль, оставленный пользователь)
+сохраняются в users_telegram_id_duplicates для ручного слияния заданий и баланса.
+
+Если за время построения индекса успел появиться новый дубль, CREATE INDEX упадёт —
+достаточно повторить alembic upgrade head: очистка и построение выполнятся заново.
+
+Revision ID: 0004
+Revises: 0003
+Create Date: 2026-10-18
+"""
+from alembic import op
+
+
+revision = "0004"
+down_revision = "0003"
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.execute(
+        """
+        CREATE TABLE IF NOT EXISTS users_telegram_id_duplicates (
+            user_id UUID PRIMARY KEY,
+            telegram_id VARCHAR NOT NULL,
+            kept_user_id UUID NOT NULL,
+            moved_at TIMESTAMP WITH TIME ZONE NOT NULL DEFAULT now()
+        )
+        """
+    )
+    op.execute(
+        """
+        WITH ranked AS (
+            SELECT
+                id,
+                telegram_id,
+                first_value(id) OVER w AS kept_user_id,
+                row_number() OVER w AS rn
+            FROM users
+            WHERE telegram_id IS NOT NULL
+            WINDOW w AS (PARTITION BY telegram_id ORDER BY created_at NULLS LAST, id)
+        ),
+        moved AS (
+            INSERT INTO users_telegram_id_duplicates (user_id, telegram_id, kept_user_id)
+            SELECT id, telegram_id, kept_user_id FROM ranked WHERE rn > 1
+            ON CONFLICT (user_id) DO UPDATE
+                SET telegram_id = EXCLUDED.telegram_id, kept_user_id = EXCLUDED.kept_user_id
+            RETURNING user_id
+        )
+        UPDATE users SET telegram_id = NULL WHERE id IN (SELECT user_id FROM moved)
+        """
+    )
+    with op.get_context().autocommit_block():
+        op.execute(
+            """
+            DO $$
+            BEGIN
+                IF EXISTS (
+                    SELECT 1 FROM pg_index i JOIN pg_class c ON c.oid = i.indexrelid
+                    WHERE c.relname = 'uq_users_telegram_id' AND NOT i.indisvalid
+                ) THEN
+                    DROP INDEX uq_users_telegram_id;
+                END IF;
+            END $$
+            """
+        )
+        op.execute("CREATE UNIQUE INDEX CONCURRENTLY IF NOT EXISTS uq_users_telegram_id ON users (telegram_id)")
+
+
+def downgrade() -> None:
+    # Обнулённые telegram_id не восстанавливаются: таблица дублей остаётся для ручного разбора
+    with op.get_context().autocommit_block():
+        op.execute("DROP INDEX CONCURRENTLY IF EXISTS uq_users_telegram_id")
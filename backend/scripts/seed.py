@@ -4,6 +4,7 @@ from decimal import Decimal
 from sqlalchemy import select
 from app.db.base import SessionLocal, engine
 from app.db.models import Category, Model, Tariff
+from app.services.catalog import publish_catalog_invalidation
 
 
 def get_or_create(session, model, defaults=None, **kwargs):
@@ -56,6 +57,11 @@ def seed():
         get_or_create(session, Tariff, name="basic", title="Базовый", monthly_tokens=600, cost_rub=499, currency="RUB")
         get_or_create(session, Tariff, name="pro", title="Про", monthly_tokens=1300, cost_rub=999, currency="RUB")
 
+        # Процессы API перечитают каталог моделей
+        try:
+            publish_catalog_invalidation()
+        except Exception as exc:
+            print(f"Catalog invalidation not published: {exc}")
         print("Seed completed")
     finally:
         session.close()
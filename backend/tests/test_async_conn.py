@@ -0,0 +1,40 @@
+import ssl
+
+from sqlalchemy.engine import make_url
+
+from app.database import _build_async_conn
+
+
+def test_libpq_query_params_are_translated_for_asyncpg():
+    url, args = _build_async_conn(
+        "postgresql://u:p@db:6432/app?sslmode=require&target_session_attrs=read-write"
+        "&application_name=api&connect_timeout=10&keepalives_idle=600",
+        {},
+    )
+    parsed = make_url(url)
+    assert parsed.drivername == "postgresql+asyncpg"
+    assert parsed.password == "p"
+    assert (parsed.host, parsed.port, parsed.database) == ("db", 6432, "app")
+    assert dict(parsed.query) == {}
+    assert isinstance(args["ssl"], ssl.SSLContext)
+    assert args["ssl"].verify_mode == ssl.CERT_NONE
+    assert args["target_session_attrs"] == "read-write"
+    assert args["timeout"] == 10.0
+    assert args["server_settings"] == {"application_name": "api"}
+
+
+def test_connect_args_override_url_and_keep_asyncpg_params():
+    url, args = _build_async_conn(
+        "postgresql://u@db/app?sslmode=disable&prepared_statement_cache_size=0&foo=bar",
+        {"host": "h1,h2", "target_session_attrs": "primary"},
+    )
+    assert dict(make_url(url).query) == {"prepared_statement_cache_size": "0"}
+    assert "ssl" not in args
+    assert args["host"] == ["h1", "h2"]
+    assert args["target_session_attrs"] == "primary"
+
+
+def test_plain_url_has_no_extra_connect_args():
+    url, args = _build_async_conn("postgresql://u:p@localhost:5432/app", {})
+    assert url == "postgresql+asyncpg://u:p@localhost:5432/app"
+    assert args == {}